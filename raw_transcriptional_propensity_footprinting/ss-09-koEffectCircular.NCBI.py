@@ -14,6 +14,10 @@ Standard output (screen output): a csv file with the following fields: `start of
 
 import sys
 import numpy as np
+import os
+# gff attribute parsing is shared with the windower, gfftools.parse_attributes
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'windower_snapshot_genome_profiling'))
+import gfftools
 
 GENOMESIZE = 4641652 # 1-based
 
@@ -21,12 +25,8 @@ def parseAttribute(attributeString):
     """
     parse the Attributes filed of GFF file (input as string), keeping only Gene or Synonym
     """
-    # cleanedString = attributeString.replace()
-    fields = attributeString.split(';')
-    newStringList = []
-    for field in fields:
-        if (field.startswith('gene=') or field.startswith('locus_tag=')):
-            newStringList += [field]
+    attributes = gfftools.parse_attributes(attributeString)
+    newStringList = [key + '=' + attributes[key] for key in ('gene', 'locus_tag') if key in attributes]
     newString = ';'.join(newStringList)
     return(newString)
 
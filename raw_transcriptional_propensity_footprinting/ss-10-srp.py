@@ -18,19 +18,17 @@ Standard error: statistics when searching SRP gene names and corresponding b-num
 from __future__ import print_function
 from __future__ import division
 import sys
+import os
+# gff attribute parsing is shared with the windower, gfftools.parse_attributes
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'windower_snapshot_genome_profiling'))
+import gfftools
 
 def parseAttribute(attributeString):
     """
     get the b-number from one Attribute field of one line from GFF file in NCBI format, keeping only Gene or Synonym
     First written in `scott-5-koEffectCircular.py`.
     """
-    fields = attributeString.split(';')
-    newStringList = []
-    for field in fields:
-        if (field.startswith('locus_tag=')):
-            newStringList += [field[10:]]
-    newString = ';'.join(newStringList)
-    return(newString)
+    return(gfftools.parse_attributes(attributeString).get('locus_tag', ''))
 
 def parseGffInputLine(gffLine):
     """
@@ -18,6 +18,10 @@ python2 ~/projects/genomeProfiling/ssPytools/mapGenenameToBnum.py /srv/diaorch/E
 
 from __future__ import print_function
 import sys
+import os
+# gff attribute parsing is shared with the windower, gfftools.parse_attributes
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'windower_snapshot_genome_profiling'))
+import gfftools
 
 def parseGffLine(gffLine, mode):
     """
@@ -26,15 +30,12 @@ def parseGffLine(gffLine, mode):
     """
     fields = gffLine.strip().split('\t')
     annotation = str(fields[8])
-    attributeFields = annotation.split(';')
-    bnum = None
-    for attribute in attributeFields:
-        if (attribute.startswith('locus_tag=')):
-            bnum = attribute[10:]
-        if (mode == 'primaryName' and attribute.startswith('Name=')):
-            newName = attribute[5:]
-        if (mode == 'synonym' and attribute.startswith('gene_synonym=')):
-            newNameList=attribute[13:].split(',')
+    attributes = gfftools.parse_attributes(annotation)
+    bnum = attributes.get('locus_tag')
+    if (mode == 'primaryName'):
+        newName = attributes['Name']
+    elif (mode == 'synonym'):
+        newNameList = attributes['gene_synonym'].split(',')
     # newName = ';'.join(newNameList)
     if (mode == 'primaryName'):
         return(bnum, newName)
@@ -37,8 +37,10 @@ def read_grfile(filename, skiprows=0):
   In the process we transpose the array, so that it has a[0] the indices and a[1] the values
   """
 
-  locs = numpy.loadtxt(filename, dtype='int', usecols=(0,), skiprows=skiprows)
-  vals = numpy.loadtxt(filename, usecols=(1,), skiprows=skiprows)
+  # parse the file once and split the columns
+  data = numpy.loadtxt(filename, usecols=(0,1), skiprows=skiprows, ndmin=2)
+  locs = data[:,0].astype('int')
+  vals = data[:,1]
   return (locs,vals)
 
 def spline_correct_genome(infile,outfile,plot=False,genome_length = 4641652, oriCloc=3923883,perspline=True):
@@ -32,6 +32,36 @@ fasta
 Module to read, write, and manipulate fasta files.
 
 """
+import mmap
+import os
+import string
+import numpy as np
+
+# table for str.translate to complement a sequence
+COMPLEMENT_TABLE = string.maketrans("ACGTNacgtn-", "TGCANtgcan-")
+
+# bases on each line when writing fasta files
+FASTA_WIDTH = 70
+# FastaFile.write collects this many bytes before writing them out
+WRITE_BUFFER_SIZE = 1 << 22
+
+def fasta_lines(seq, width=FASTA_WIDTH):
+    """
+    Wrap seq into lines of width bases, as a single str with a line ending
+    after every line
+
+    >>> fasta_lines("AAGGTTC", 3)
+    'AAG\\nGTT\\nC\\n'
+    >>> fasta_lines("")
+    ''
+    """
+    lines = [seq[i:i+width] for i in xrange(0, len(seq), width)]
+    lines.append("")
+    return "\n".join(lines)
+
+# 2-bit codes of each base for PackedSequence. Complementing a base is 3
+# minus its code
+PACKED_BASES = "ACGT"
 
 def complement(sequence):
     """Complement a nucleotide sequence
@@ -41,16 +71,10 @@ def complement(sequence):
     'TCNA'
     >>> complement("AG-T")
     'TC-A'
+    >>> complement("agnt")
+    'tcna'
     """
-    # create a dictionary to act as a mapper
-    comp_dict = {'A': 'T', 'G':'C', 'C':'G', 'T': 'A', 'N':'N', '-':'-'}
-    # turn the sequence into a list
-    sequence = list(sequence)
-    # remap it to the compelmentary sequence using the mapping dict
-    sequence = [comp_dict[base] for base in sequence]
-    # join the new complemented sequence list into a string
-    sequence = ''.join(sequence)
-    return sequence
+    return sequence.translate(COMPLEMENT_TABLE)
 
 class FastaEntry(object):
     """ 
@@ -80,14 +104,19 @@ class FastaEntry(object):
     def __str__(self):
         return "<FastaEntry>" + self.chrm_name() + ":" + str(len(self))
 
-    def write(self,fhandle):
-        fhandle.write(self.header+"\n")
-        for i in range(0,len(self), 70):
-            try:
-                fhandle.write(self.seq[i:i+70]+"\n")
-            except IndexError:
-                fhandle.write(self.seq[i:-1] + "\n")
+    def write(self, fhandle, width=FASTA_WIDTH):
+        """
+        Write the entry to fhandle in a single call, with width bases on
+        each line
+        """
+        fhandle.write(self.fasta_text(width))
 
+    def fasta_text(self, width=FASTA_WIDTH):
+        """
+        The entry as it is written to a fasta file, with width bases on each
+        line
+        """
+        return self.header + "\n" + fasta_lines(self.seq, width)
 
     def set_header(self, header):
         self.header = header
@@ -101,6 +130,13 @@ class FastaEntry(object):
         else:
             return(len(self.seq))
 
+    def subseq(self, start, end):
+        """
+        Same as self.seq[start:end], for entries that don't keep the whole
+        sequence in memory
+        """
+        return self.seq[start:end]
+
     def pull_seq(self, start, end, circ=False, rc=False):
         """ 
         Obtain a subsequence from the fasta entry sequence
@@ -136,16 +172,112 @@ class FastaEntry(object):
                 raise ValueError("Start %s is outside the length of the sequence %s"%(start,seq_len))
         if end > seq_len:
             if circ:
-                seq = self.seq[start:seq_len] + self.seq[0:(end-seq_len)]
+                seq = self.subseq(start, seq_len) + self.subseq(0, end-seq_len)
             else: 
                 raise ValueError("End %s is outside length of sequence %s"%(end,seq_len))
         else:
-            seq = self.seq[start:end]
+            seq = self.subseq(start, end)
         if rc:
             return complement(seq)[::-1]
         else:
             return seq.upper()
 
+    def pull_seqs(self, starts, ends, strands=None, circ=True, as_array=False):
+        """
+        Pull many subsequences at once. Gives the same sequences as calling
+        pull_seq for each window, with rc=True for windows on the "-"
+        strand, but the windows are moved around the origin together and
+        only the windows on the "-" strand are complemented.
+
+        Args:
+            starts (np.array): start of each window, as for pull_seq
+            ends (np.array): end of each window, as for pull_seq
+            strands (list): strand of each window, default all "+"
+            circ (boolean): as for pull_seq
+            as_array (boolean): return the sequences as the rows of a 2-D
+                                np.array of bytes. They must all be the same
+                                length
+        Returns:
+            list of str, or 2-D np.array of uint8 if as_array is True
+
+        Raises:
+            ValueError: for the same windows pull_seq raises it for
+            ValueError: If as_array is True and the windows aren't all the
+                        same length
+
+        >>> entry = FastaEntry(">chr", "AAGGTTCC")
+        >>> entry.pull_seqs([0, 6, 2], [3, 10, 4], ["+", "+", "-"])
+        ['AAG', 'CCAA', 'CC']
+        >>> entry.pull_seqs([0, 7], [2, 9], as_array=True).tostring()
+        'AACA'
+        """
+        seq_len = len(self)
+        starts = np.asarray(starts, dtype=int)
+        ends = np.asarray(ends, dtype=int)
+        if strands is None:
+            minus = np.zeros(len(starts), dtype=np.bool_)
+        else:
+            minus = np.asarray(strands) == "-"
+        # move windows to start inside the sequence the same way pull_seq
+        # does
+        shift = np.zeros(len(starts), dtype=int)
+        if circ:
+            shift[starts < 0] = seq_len
+            shift[starts >= seq_len] = -seq_len
+        starts = starts + shift
+        ends = np.minimum(ends + shift, 2*seq_len)
+        # windows that still don't, or that go round the sequence more than
+        # once, are left to pull_seq, which also raises the errors for them
+        odd = (starts < 0) | (starts >= seq_len) | (ends < 0)
+        if not circ:
+            odd |= ends > seq_len
+        odd_seqs = dict((i, self.pull_seq(starts[i] - shift[i], ends[i] - shift[i],
+                                          circ=circ, rc=minus[i]))
+                        for i in np.flatnonzero(odd))
+        starts[odd] = 0
+        ends[odd] = 0
+        seqs = self.subseqs(starts, ends)
+        if as_array:
+            lengths = np.array([len(seq) for seq in seqs], dtype=int)
+            for i, seq in odd_seqs.iteritems():
+                lengths[i] = len(seq)
+            if len(lengths) and (lengths != lengths[0]).any():
+                raise ValueError("Windows must all be the same length to pull them as an array")
+            width = lengths[0] if len(lengths) else 0
+            for i, seq in odd_seqs.iteritems():
+                seqs[i] = seq
+            codes = np.frombuffer("".join(seqs), dtype=np.uint8).reshape(len(seqs), width)
+            all_codes = string.maketrans("", "")
+            plus = ~minus
+            plus[odd_seqs.keys()] = False
+            minus[odd_seqs.keys()] = False
+            out = codes.copy()
+            out[plus] = np.frombuffer(all_codes.upper(), dtype=np.uint8)[codes[plus]]
+            if minus.any():
+                complement_codes = np.frombuffer(complement(all_codes), dtype=np.uint8)
+                out[minus] = complement_codes[codes[minus]][:,::-1]
+            return out
+        seqs = [complement(seq)[::-1] if rc else seq.upper()
+                for seq, rc in zip(seqs, minus.tolist())]
+        for i, seq in odd_seqs.iteritems():
+            seqs[i] = seq
+        return seqs
+
+    def subseqs(self, starts, ends):
+        """
+        Same as self.subseq for each [start, end) window, where the windows
+        start inside the sequence and the ones that end past its end carry
+        on from its beginning. Only the bases of each window are read
+
+        >>> FastaEntry(">chr", "AAGGTTCc").subseqs(np.array([1, 6]), np.array([3, 10]))
+        ['AG', 'CcAA']
+        """
+        seq_len = len(self)
+        subseq = self.subseq
+        return [subseq(start, end) if end <= seq_len else
+                subseq(start, seq_len) + subseq(0, end - seq_len)
+                for start, end in zip(starts.tolist(), ends.tolist())]
+
     def chrm_name(self):
         """
         Pulls the chromosome name from the header attribute.
@@ -159,6 +291,353 @@ class FastaEntry(object):
         return self.header[1:]
                 
 
+class PackedSequence(object):
+    """
+    A sequence stored as 2 bits per base, with a mask of the positions that
+    aren't A, C, G or T (stored as an A). Those are nearly always N, which is
+    what a masked position decodes to; any other characters are kept
+    separately by position. Sequences are stored in upper case.
+
+    Args:
+        seq (str): sequence to store
+
+    >>> packed = PackedSequence("ACGTNacgtRA")
+    >>> len(packed), packed.tostring()
+    (11, 'ACGTNACGTRA')
+    >>> packed[2:7], packed[-3:], packed[5:2]
+    ('GTNAC', 'TRA', '')
+    >>> packed.reverse_complement(1, 5)
+    'NACG'
+    """
+
+    def __init__(self, seq=""):
+        codes = np.frombuffer(seq.upper(), dtype=np.uint8)
+        lookup = np.full(256, 4, dtype=np.uint8)
+        for code, base in enumerate(PACKED_BASES):
+            lookup[ord(base)] = code
+        base_codes = lookup[codes]
+        masked = base_codes == 4
+        base_codes[masked] = 0
+        self.length = len(codes)
+        padded = np.zeros(-(-self.length//4)*4, dtype=np.uint8)
+        padded[:self.length] = base_codes
+        padded = padded.reshape(-1, 4)
+        self.packed = ((padded[:,0] << 6) | (padded[:,1] << 4) |
+                       (padded[:,2] << 2) | padded[:,3])
+        self.mask = np.packbits(masked)
+        others = np.flatnonzero(masked & (codes != ord("N")))
+        self.other_positions = others
+        self.other_bases = codes[others]
+
+    def __len__(self):
+        return self.length
+
+    def codes(self, start, end):
+        """
+        Codes of the bases in [start, end) as an np.array of uint8. Masked
+        positions are 4. Start and end must be within the sequence
+        """
+        if end <= start:
+            return np.zeros(0, dtype=np.uint8)
+        first = start//4
+        packed = self.packed[first:-(-end//4)]
+        codes = np.empty((len(packed), 4), dtype=np.uint8)
+        for i, shift in enumerate((6, 4, 2, 0)):
+            codes[:,i] = (packed >> shift) & 3
+        codes = codes.ravel()[start - first*4:end - first*4]
+        first = start//8
+        masked = np.unpackbits(self.mask[first:-(-end//8)])
+        codes[masked[start - first*8:end - first*8].astype(np.bool_)] = 4
+        return codes
+
+    def decode(self, start, end, rc=False):
+        """
+        The str of the bases in [start, end), reverse complemented if rc is
+        True. Start and end must be within the sequence
+        """
+        codes = self.codes(start, end)
+        if rc:
+            alphabet = np.frombuffer(complement(PACKED_BASES) + "N", dtype=np.uint8)
+        else:
+            alphabet = np.frombuffer(PACKED_BASES + "N", dtype=np.uint8)
+        chars = alphabet[codes]
+        first = np.searchsorted(self.other_positions, start)
+        last = np.searchsorted(self.other_positions, end)
+        if last > first:
+            others = self.other_bases[first:last]
+            if rc:
+                others = np.frombuffer(complement(others.tostring()), dtype=np.uint8)
+            chars[self.other_positions[first:last] - start] = others
+        if rc:
+            chars = chars[::-1]
+        return chars.tostring()
+
+    def take(self, positions):
+        """
+        The bases at each of an np.array of positions within the sequence,
+        as a str
+
+        >>> PackedSequence("ACGTNacgtRA").take(np.array([9, 0, 4, 3, 3]))
+        'RANTT'
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        codes = (self.packed[positions//4] >> (6 - 2*(positions%4))) & 3
+        masked = (self.mask[positions//8] >> (7 - positions%8)) & 1
+        codes[masked.astype(np.bool_)] = 4
+        chars = np.frombuffer(PACKED_BASES + "N", dtype=np.uint8)[codes]
+        if len(self.other_positions):
+            others = np.minimum(np.searchsorted(self.other_positions, positions),
+                                len(self.other_positions) - 1)
+            other = self.other_positions[others] == positions
+            chars[other] = self.other_bases[others[other]]
+        return chars.tostring()
+
+    def __getitem__(self, index):
+        """
+        Slice the sequence like a str. Returns a str
+        """
+        if not isinstance(index, slice):
+            index = slice(index, index + 1 if index != -1 else None)
+        start, end, step = index.indices(self.length)
+        seq = self.decode(start, max(start, end))
+        if step != 1:
+            seq = seq[::step]
+        return seq
+
+    def reverse_complement(self, start, end):
+        """
+        The reverse complement of the bases in [start, end) as a str
+        """
+        start, end, step = slice(start, end).indices(self.length)
+        return self.decode(start, max(start, end), rc=True)
+
+    def tostring(self):
+        return self.decode(0, self.length)
+
+class PackedFastaEntry(FastaEntry):
+    """
+    A FastaEntry that stores its sequence as a PackedSequence, taking a
+    quarter of the memory. The seq attribute is only turned back into a str
+    when it is asked for, and pull_seq only decodes the bases it returns.
+
+    Args:
+        header (str): The complete string for the header
+        seq (str): The complete string for the entire sequence of the entry
+
+    >>> entry = PackedFastaEntry(">chr", "AAGGTTCCnn")
+    >>> entry.pull_seq(8, 12, circ=True), entry.pull_seq(2, 5, rc=True)
+    ('NNAA', 'ACC')
+    >>> entry.pull_seq(8, 12, circ=True, rc=True)
+    'TTNN'
+    """
+
+    def __init__(self, header = ">", seq = ""):
+        self.header = header
+        self.packed = PackedSequence(seq)
+        self.length = None
+
+    @property
+    def seq(self):
+        return self.packed.tostring()
+
+    def set_seq(self, seq):
+        self.packed = PackedSequence(seq)
+
+    def __len__(self):
+        if self.length:
+            return self.length
+        else:
+            return len(self.packed)
+
+    def subseqs(self, starts, ends):
+        """
+        See FastaEntry.subseqs. Only the bases in the windows are decoded
+
+        >>> PackedFastaEntry(">chr", "AAGGTTCc").subseqs(np.array([1, 6]), np.array([3, 10]))
+        ['AG', 'CCAA']
+        """
+        lengths = np.maximum(ends - starts, 0)
+        offsets = np.cumsum(lengths) - lengths
+        positions = (np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths))%len(self)
+        bases = self.packed.take(positions)
+        return [bases[offset:offset + length]
+                for offset, length in zip(offsets.tolist(), lengths.tolist())]
+
+    def pull_seq(self, start, end, circ=False, rc=False):
+        """
+        See FastaEntry.pull_seq
+        """
+        seq_len = len(self)
+        if start < 0 or start >= seq_len:
+            if circ:
+                if start < 0:
+                    start = seq_len + start
+                    end = seq_len + end
+                elif start >= seq_len:
+                    start = start - seq_len
+                    end = end - seq_len
+            else:
+                raise ValueError("Start %s is outside the length of the sequence %s"%(start,seq_len))
+        if end > seq_len and not circ:
+            raise ValueError("End %s is outside length of sequence %s"%(end,seq_len))
+        if rc:
+            if end > seq_len:
+                return (self.packed.reverse_complement(0, end-seq_len) +
+                        self.packed.reverse_complement(start, seq_len))
+            return self.packed.reverse_complement(start, end)
+        if end > seq_len:
+            return self.packed[start:seq_len] + self.packed[0:(end-seq_len)]
+        return self.packed[start:end]
+
+def build_fasta_index(fhandle):
+    """
+    Index a fasta file the way samtools faidx does, so any part of any
+    entry can be found without reading the rest of the file. Every line of
+    an entry but its last must have the same length.
+
+    Args:
+        fhandle (File): fasta file opened for reading
+    Returns:
+        list of (name, length, offset, line_bases, line_bytes) for each entry:
+        the length of its sequence, the byte offset its sequence starts at,
+        the number of bases on each line and the number of bytes on each line
+        including the line ending
+
+    Raises:
+        ValueError: If fasta file does not start with a header ">"
+        ValueError: If the lines of an entry aren't all the same length
+        ValueError: If there is a blank line in the sequence of an entry
+
+    >>> import StringIO
+    >>> build_fasta_index(StringIO.StringIO(">a\\nACG\\nAC\\n\\n>b x\\nAAAA\\n"))
+    [('a', 5, 3, 3, 4), ('b', 4, 16, 4, 5)]
+    >>> build_fasta_index(StringIO.StringIO(">a\\nACG\\n\\nAC\\n"))
+    Traceback (most recent call last):
+    ...
+    ValueError: a has a blank line in its sequence so it can't be indexed
+    """
+    index = []
+    entry = None
+    offset = 0
+    for line in iter(fhandle.readline, ''):
+        line_bytes = len(line)
+        offset += line_bytes
+        if line.startswith(">"):
+            if entry is not None:
+                index.append(tuple(entry[:5]))
+            # name, length, offset, line_bases, line_bytes, whether a short
+            # line has been seen, whether a blank line has been seen
+            entry = [line[1:].split()[0], 0, offset, 0, 0, False, False]
+            continue
+        if entry is None:
+            if line.strip():
+                raise ValueError("File is missing initial header!")
+            continue
+        bases = len(line.rstrip("\r\n"))
+        if bases == 0:
+            # only allowed after the last line of the entry
+            entry[6] = True
+            continue
+        if entry[6]:
+            raise ValueError("%s has a blank line in its sequence so it can't be indexed"%entry[0])
+        if entry[3] == 0:
+            entry[3] = bases
+            entry[4] = line_bytes
+        elif entry[5] or bases > entry[3] or (bases == entry[3] and line_bytes != entry[4]):
+            raise ValueError("Lines of %s are different lengths so it can't be indexed"%entry[0])
+        if bases < entry[3]:
+            entry[5] = True
+        entry[1] += bases
+    if entry is None:
+        raise ValueError("File is missing initial header!")
+    index.append(tuple(entry[:5]))
+    return index
+
+def write_fasta_index(index, fhandle):
+    """
+    Write an index from build_fasta_index as a .fai file
+    """
+    for entry in index:
+        fhandle.write("\t".join(str(field) for field in entry) + "\n")
+
+def read_fasta_index(fhandle):
+    """
+    Read an index written by write_fasta_index or samtools faidx
+    """
+    index = []
+    for line in fhandle:
+        fields = line.rstrip("\r\n").split("\t")
+        index.append((fields[0],) + tuple(int(field) for field in fields[1:5]))
+    return index
+
+class IndexedFastaEntry(FastaEntry):
+    """
+    A FastaEntry whose sequence stays in a memory mapped fasta file. Only the
+    bytes of the bases that are pulled are read.
+
+    Args:
+        header (str): The complete string for the header
+        fasta_map (mmap): the memory mapped fasta file
+        offset (int): byte offset of the start of the sequence in the file
+        length (int): length of the sequence
+        line_bases (int): number of bases on each line
+        line_bytes (int): number of bytes on each line, with its line ending
+    """
+    def __init__(self, header, fasta_map, offset, length, line_bases, line_bytes):
+        self.header = header
+        self.fasta_map = fasta_map
+        self.offset = offset
+        self.length = length
+        self.line_bases = line_bases
+        self.line_bytes = line_bytes
+
+    @property
+    def seq(self):
+        return self.subseq(0, self.length)
+
+    def __len__(self):
+        return self.length
+
+    def subseq(self, start, end):
+        start, end, step = slice(start, end).indices(self.length)
+        if end <= start:
+            return ""
+        line_bases = self.line_bases
+        line_bytes = self.line_bytes
+        first = self.offset + start//line_bases*line_bytes + start%line_bases
+        last = self.offset + (end-1)//line_bases*line_bytes + (end-1)%line_bases + 1
+        return self.fasta_map[first:last].replace("\n", "").replace("\r", "")
+
+    def byte_offsets(self, positions):
+        """
+        Offset in the file of the base at each of an np.array of positions
+        """
+        return (self.offset + positions//self.line_bases*self.line_bytes +
+                positions%self.line_bases)
+
+    def subseqs(self, starts, ends):
+        """
+        See FastaEntry.subseqs. The bytes of every window are read from the
+        file and their line endings removed all at once
+
+        >>> text = ">chr\\nAAGGT\\nTCc\\n"
+        >>> entry = IndexedFastaEntry(">chr", text, 5, 8, 5, 6)
+        >>> entry.subseqs(np.array([1, 4, 6, 3]), np.array([6, 4, 10, 11]))
+        ['AGGTT', '', 'CcAA', 'GTTCcAAG']
+        """
+        seq_len = self.length
+        ends = np.maximum(ends, starts)
+        firsts = self.byte_offsets(starts)
+        lasts = np.maximum(self.byte_offsets(np.minimum(ends, seq_len) - 1) + 1, firsts)
+        fasta_map = self.fasta_map
+        pieces = [fasta_map[first:last] for first, last in zip(firsts.tolist(), lasts.tolist())]
+        for i in np.flatnonzero(ends > seq_len):
+            pieces[i] += fasta_map[self.offset:self.byte_offsets(ends[i] - seq_len - 1) + 1]
+        bases = "".join(pieces).replace("\n", "").replace("\r", "")
+        lengths = (ends - starts).tolist()
+        offsets = np.cumsum([0] + lengths).tolist()
+        return [bases[offset:offset + length] for offset, length in zip(offsets, lengths)]
+
 class FastaFile(object):
     """ 
     Stores all the information for a single fasta file.
@@ -171,14 +650,19 @@ class FastaFile(object):
     >anotherchromosomename
     AGAGATACACACATATA...ATACAT #typically 50 bases per line
 
+    Args:
+        packed (bool): store the entries as PackedFastaEntry objects
+
     Attributes:
         data (dict): where the keys are the chromosome names and the entries are
                      FastaEntry objects for each key
     """
 
-    def __init__(self):
+    def __init__(self, packed=False):
         self.data = {}
         self.names = []
+        # store each entry as a PackedFastaEntry
+        self.packed = packed
 
     def __iter__(self):
         for name in self.names:
@@ -203,7 +687,7 @@ class FastaFile(object):
         if line[0] != ">":
             raise ValueError("File is missing initial header!")
         else:
-            curr_entry = FastaEntry(header = line.rstrip().split()[0])
+            curr_entry = self.entry_class()(header = line.rstrip().split()[0])
         line = fhandle.readline().strip()
         curr_seq = []
         while line != '':
@@ -212,7 +696,7 @@ class FastaFile(object):
                 self.data[curr_entry.chrm_name()] = curr_entry
                 self.names.append(curr_entry.chrm_name())
                 curr_seq = []
-                curr_entry = FastaEntry(line)
+                curr_entry = self.entry_class()(header = line.rstrip().split()[0])
             else:
                 curr_seq.append(line)
 
@@ -220,6 +704,46 @@ class FastaFile(object):
 
         curr_entry.set_seq(''.join(curr_seq))
         self.data[curr_entry.chrm_name()] = curr_entry
+        self.names.append(curr_entry.chrm_name())
+
+    def read_indexed_file(self, fname, write_index=True):
+        """
+        Memory map a fasta file instead of reading it in, using its .fai
+        index to find each entry. Sequence is only read from the file as it
+        is pulled out of the entries. If there is no index it is built, and
+        saved as fname.fai when write_index is True and the directory can be
+        written to.
+
+        Args:
+            fname (str): name of the fasta file
+            write_index (bool): save the index if it has to be built
+        Returns:
+            None
+        """
+        index_fname = fname + ".fai"
+        if (os.path.exists(index_fname) and
+                os.path.getmtime(index_fname) >= os.path.getmtime(fname)):
+            with open(index_fname) as fhandle:
+                index = read_fasta_index(fhandle)
+        else:
+            with open(fname, "rb") as fhandle:
+                index = build_fasta_index(fhandle)
+            if write_index:
+                try:
+                    with open(index_fname, "w") as fhandle:
+                        write_fasta_index(index, fhandle)
+                except IOError:
+                    pass
+        with open(fname, "rb") as fhandle:
+            self.fasta_map = mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+        for name, length, offset, line_bases, line_bytes in index:
+            self.add_entry(IndexedFastaEntry(">" + name, self.fasta_map, offset,
+                                             length, line_bases, line_bytes))
+
+    def entry_class(self):
+        if self.packed:
+            return PackedFastaEntry
+        return FastaEntry
 
     def pull_entry(self, chrm):
         """
@@ -250,16 +774,54 @@ class FastaFile(object):
     def chrm_names(self):
         return self.data.keys()
 
-    def write(self, fhandle):
+    def write(self, fhandle, width=FASTA_WIDTH, index_fhandle=None):
         """ 
-        Write the contents of self.data into a fasta format
+        Write the contents of self.data into a fasta format, in the order
+        the entries were added. The text of the entries is collected into
+        large blocks so the file is written in a few calls.
 
         Args:
             fhandle (File)    : A python file handle set with mode set to write
+            width (int)       : number of bases on each line
+            index_fhandle (File): if given, the .fai index of the fasta file
+                                  is written to it
         Returns:
             None
 
+        >>> import StringIO
+        >>> fasta_file = FastaFile()
+        >>> fasta_file.add_entry(FastaEntry(">b", "ACGTACG"))
+        >>> fasta_file.add_entry(FastaEntry(">a", "TT"))
+        >>> out, index_out = StringIO.StringIO(), StringIO.StringIO()
+        >>> fasta_file.write(out, width=3, index_fhandle=index_out)
+        >>> out.getvalue()
+        '>b\\nACG\\nTAC\\nG\\n>a\\nTT\\n'
+        >>> out.seek(0)
+        >>> build_fasta_index(out) == read_fasta_index(StringIO.StringIO(index_out.getvalue()))
+        True
         """
-        for chrm in self.chrm_names():
+        index = []
+        blocks = []
+        buffered = 0
+        offset = 0
+        written = set()
+        for chrm in self.names:
+            if chrm in written:
+                continue
+            written.add(chrm)
             entry = self.pull_entry(chrm)
-            entry.write(fhandle)
+            text = entry.fasta_text(width)
+            length = len(entry)
+            line_bases = min(width, length)
+            index.append((chrm, length, offset + len(entry.header) + 1,
+                          line_bases, line_bases + 1 if length else 0))
+            offset += len(text)
+            blocks.append(text)
+            buffered += len(text)
+            if buffered >= WRITE_BUFFER_SIZE:
+                fhandle.write("".join(blocks))
+                blocks = []
+                buffered = 0
+        fhandle.write("".join(blocks))
+        if index_fhandle is not None:
+            write_fasta_index(index, index_fhandle)
@@ -35,6 +35,43 @@
 #WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 #CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE SOFTWARE.
 
+import re
+import numpy as np
+
+# one ;-separated attribute, where a ; inside double quotes doesn't separate
+ATTRIBUTE_RE = re.compile(r'(?:[^;"]|"[^"]*"|")+')
+# end of the key of an attribute, = for gff3 and whitespace for gtf
+KEY_END_RE = re.compile(r'[=\s]')
+
+def parse_attributes(comments):
+  """
+  Parse the attribute column of a gff line into a dict. Handles gff3
+  key=value pairs and gtf key "value" pairs, and ; inside quotes. Quotes are
+  kept in the values. A key with no value gets ""
+
+  >>> sorted(parse_attributes('Gene "g0"; Synonym "b0000"').items())
+  [('Gene', '"g0"'), ('Synonym', '"b0000"')]
+  >>> sorted(parse_attributes("ID=gene1;Name=thrL;Note=a;b").items())
+  [('ID', 'gene1'), ('Name', 'thrL'), ('Note', 'a'), ('b', '')]
+  >>> parse_attributes('Note "a;b";')
+  {'Note': '"a;b"'}
+  """
+
+  attributes = {}
+  for pair in ATTRIBUTE_RE.findall(comments):
+    pair = pair.strip()
+    if not pair:
+      continue
+    key_end = KEY_END_RE.search(pair)
+    if key_end is None:
+      attributes[pair] = ""
+    elif pair[key_end.start()] == "=":
+      attributes[pair[:key_end.start()]] = pair[key_end.end():]
+    else:
+      attributes[pair[:key_end.start()]] = pair[key_end.end():].strip()
+  return attributes
+
+
 class GffEntry:
   """
   A simple container class for the equivalent of a gff file line
@@ -88,17 +125,10 @@ class GffData:
 
   def __init__(self):
     self.data = []
-    self.index = 0
 
   def __iter__(self):
-    return self
-
-  def next(self):
-    if self.index == len(self.data):
-      self.index = 0
-      raise StopIteration
-    self.index = self.index + 1
-    return self.data[self.index-1]
+    # a new iterator each time, so loops over the same GffData can be nested
+    return iter(self.data)
 
 
 
@@ -122,11 +152,20 @@ class GffData:
 
   def cleanup(self):
     """
-    Remove all duplicate entries and sort based on starting position
+    Remove all duplicate entries and sort based on starting position.
+    Entries are duplicates if they have the same genome name, start, end and
+    direction, and the first of them is kept
     """
 
-    self.data = list(set(self.data))
-    self.data.sort(cmp=lambda a,b: cmp(a.start, b.start))
+    seen = set()
+    entries = []
+    for entry in self.data:
+      key = (entry.genome_name, entry.start, entry.end, entry.direction)
+      if key not in seen:
+        seen.add(key)
+        entries.append(entry)
+    entries.sort(key=lambda entry: entry.start)
+    self.data = entries
 
   def write_gff_file(self, filename):
     """
@@ -181,3 +220,578 @@ class GffData:
     self.data.append(new_entry)
 
 
+def _column_property(column, convert=None):
+  """
+  Property of a GffRow that reads and writes its value in a GffTable column
+  """
+
+  def get(self):
+    value = getattr(self.table, column)[self.row]
+    if convert is not None:
+      return convert(value)
+    return value
+
+  def set(self, value):
+    getattr(self.table, column)[self.row] = value
+    if column == "comments":
+      self.table.comment_dicts[self.row] = None
+
+  return property(get, set)
+
+
+class GffRow(object):
+  """
+  A view of one row of a GffTable, with the same attributes as a GffEntry.
+  Setting an attribute changes the table
+  """
+
+  __slots__ = ("table", "row")
+
+  def __init__(self, table, row):
+    self.table = table
+    self.row = row
+
+  genome_name = _column_property("genome_name")
+  data_origin = _column_property("data_origin")
+  site_type = _column_property("site_type")
+  start = _column_property("start", int)
+  end = _column_property("end", int)
+  direction = _column_property("direction", str)
+  comments = _column_property("comments")
+
+  @property
+  def comment_dict(self):
+    return self.table.attributes(self.row)
+
+  @comment_dict.setter
+  def comment_dict(self, comment_dict):
+    self.table.comment_dicts[self.row] = comment_dict
+
+  def __repr__(self):
+    return GffEntry.FORMAT_STRING % (self.genome_name, self.data_origin, self.site_type, self.start, self.end, self.direction, self.comments)
+
+
+class GffTable(object):
+  """
+  Class for storing gff data column by column. start and end are np.arrays
+  of ints, direction a np.array of one character strings and the others
+  np.arrays of interned strings. Rows are GffRow views, so a GffTable can
+  be used in place of a GffData, and it can be filtered on whole columns at
+  once
+
+  >>> table = GffTable()
+  >>> table.parse_gff_lines(["##gff-version 3\\n",
+  ...                        "chr\\tsrc\\tgene\\t1\\t90\\t.\\t+\\t.\\tID=a\\n",
+  ...                        "chr\\tsrc\\tCDS\\t100\\t190\\t.\\t-\\t0\\tID=b\\n",
+  ...                        "chr\\tsrc\\tgene\\t150\\t400\\t.\\t-\\t.\\tID=c\\n"])
+  >>> len(table), table.start.tolist(), table[-1].comments
+  (3, [1, 100, 150], 'ID=c')
+  >>> [row.comments for row in table.filter(site_type="gene", start=80, end=120)]
+  ['ID=a']
+  >>> table.filter(direction="-", start=170).start.tolist()
+  [100, 150]
+  >>> table.attribute_index("ID")["b"], table[1].comment_dict
+  ([1], {'ID': 'b'})
+  >>> [row.comments for row in table.find_entry(lambda x: x.end > 150, findall=True)]
+  ['ID=b', 'ID=c']
+  """
+
+  COLUMNS = ("genome_name", "data_origin", "site_type", "start", "end", "direction", "comments")
+
+  def __init__(self):
+    self.set_columns([], [], [], [], [], [], [])
+
+  def set_columns(self, genome_name, data_origin, site_type, start, end, direction, comments):
+    """
+    Replace the contents of the table with these columns
+    """
+
+    self.genome_name = np.array(genome_name, dtype=object)
+    self.data_origin = np.array(data_origin, dtype=object)
+    self.site_type = np.array(site_type, dtype=object)
+    self.start = np.array(start, dtype=np.int64)
+    self.end = np.array(end, dtype=np.int64)
+    self.direction = np.array(direction, dtype="S1")
+    self.comments = np.array(comments, dtype=object)
+    # parsed comments of each row, filled in as they are needed
+    self.comment_dicts = [None]*len(self.start)
+
+  @classmethod
+  def from_intervals(cls, starts, ends, genome_name="chr", data_origin=".", site_type="region",
+                     direction="+", comments=""):
+    """
+    A GffTable with a row for each interval, such as the result of
+    merge_intervals, to write out as windows. The other columns are the same
+    for every row
+
+    >>> genes = GffTable.from_intervals([3, 12], [8, 18], site_type="gene")
+    >>> intergenic = GffTable.from_intervals(*complement_intervals(genes.start, genes.end, 20))
+    >>> zip(intergenic.start, intergenic.end)
+    [(9, 11), (19, 22)]
+    """
+
+    table = cls()
+    nrows = len(starts)
+    table.set_columns([genome_name]*nrows, [data_origin]*nrows, [site_type]*nrows, starts, ends,
+                      [direction]*nrows, [comments]*nrows)
+    return table
+
+  def to_arrays(self):
+    """
+    dict of the columns with the strings stored as np.string_ arrays, which
+    can be saved with np.savez and read back without pickling
+    """
+
+    arrays = {}
+    for column in GffTable.COLUMNS:
+      array = getattr(self, column)
+      if array.dtype == object:
+        array = array.astype(str) if len(array) else np.array([], dtype="S1")
+      arrays[column] = array
+    return arrays
+
+  @classmethod
+  def from_arrays(cls, arrays):
+    """
+    A GffTable of columns from to_arrays
+
+    >>> table = GffTable.from_intervals([3, 12], [8, 18], comments="ID=a")
+    >>> row = GffTable.from_arrays(table.to_arrays())[1]
+    >>> row.genome_name, row.end, row.comments
+    ('chr', 18, 'ID=a')
+    """
+
+    table = cls()
+    columns = []
+    for column in GffTable.COLUMNS:
+      array = arrays[column]
+      if array.dtype.kind == "S":
+        array = [intern(value) for value in array.tolist()]
+      columns.append(array)
+    table.set_columns(*columns)
+    return table
+
+  def parse_gff_file(self, filename):
+    """
+    Parse a gff file and store its lines in the columns. Lines starting
+    with # are skipped, and anything after a ##FASTA line
+    """
+
+    instr = open(filename, "r")
+    self.parse_gff_lines(instr)
+    instr.close()
+
+  def parse_gff_lines(self, lines):
+    """
+    Store the gff lines in the columns, see parse_gff_file
+    """
+
+    columns = ([], [], [], [], [], [], [])
+    genome_name, data_origin, site_type, start, end, direction, comments = columns
+    for line in lines:
+      if line.startswith("#"):
+        if line.startswith("##FASTA"):
+          break
+        continue
+      if not line.strip():
+        continue
+      datarray = line.rstrip("\n").split("\t")
+      genome_name.append(intern(datarray[0]))
+      data_origin.append(intern(datarray[1]))
+      site_type.append(intern(datarray[2]))
+      start.append(int(datarray[3]))
+      end.append(int(datarray[4]))
+      direction.append(datarray[6])
+      comments.append(" ".join(datarray[8:]).replace("\n", ""))
+    self.set_columns(*columns)
+
+  def attributes(self, row):
+    """
+    The parsed comments of a row, see parse_attributes. They're only parsed
+    the first time they're asked for
+    """
+
+    comment_dict = self.comment_dicts[row]
+    if comment_dict is None:
+      comment_dict = parse_attributes(self.comments[row])
+      self.comment_dicts[row] = comment_dict
+    return comment_dict
+
+  def attribute_index(self, key):
+    """
+    dict from each value of the key attribute to a list of the rows that have
+    it. Rows without the key are left out
+    """
+
+    index = {}
+    for row in xrange(len(self)):
+      value = self.attributes(row).get(key)
+      if value is not None:
+        index.setdefault(value, []).append(row)
+    return index
+
+  def __len__(self):
+    return len(self.start)
+
+  def __iter__(self):
+    for row in xrange(len(self)):
+      yield GffRow(self, row)
+
+  def __getitem__(self, index):
+    """
+    A GffRow for an int index, otherwise a new GffTable of the rows picked
+    out by a slice, np.array of indices or boolean mask
+    """
+
+    if isinstance(index, (int, long, np.integer)):
+      if index < 0:
+        index += len(self)
+      if index < 0 or index >= len(self):
+        raise IndexError("GffTable index out of range")
+      return GffRow(self, index)
+    return self.take(index)
+
+  def take(self, index):
+    """
+    A new GffTable with the rows picked out by index
+    """
+
+    table = GffTable()
+    table.set_columns(*[getattr(self, column)[index] for column in GffTable.COLUMNS])
+    table.comment_dicts = [self.comment_dicts[row] for row in np.arange(len(self))[index]]
+    return table
+
+  def dedupe(self):
+    """
+    A new GffTable with only the first of the rows that have the same genome
+    name, start, end and direction, sorted by start
+    """
+
+    if len(self) == 0:
+      return self.take(np.arange(0))
+    # number the genome names so every column can be sorted together
+    names, name_codes = np.unique(self.genome_name.astype(str), return_inverse=True)
+    order = np.lexsort((np.arange(len(self)), self.direction, self.end, self.start, name_codes))
+    keys = [name_codes[order], self.start[order], self.end[order], self.direction[order]]
+    first = np.ones(len(self), dtype=bool)
+    first[1:] = np.any([key[1:] != key[:-1] for key in keys], axis=0)
+    keep = np.sort(order[first])
+    return self.take(keep[np.argsort(self.start[keep], kind="mergesort")])
+
+  def mask(self, site_type=None, direction=None, genome_name=None, start=None, end=None):
+    """
+    Boolean np.array of the rows that match all of the given values. site_type
+    and genome_name can be one string or a list of them. Rows match start and
+    end if they overlap the range from start to end, inclusive
+    """
+
+    keep = np.ones(len(self), dtype=bool)
+    for column, values in (("site_type", site_type), ("genome_name", genome_name)):
+      if values is None:
+        continue
+      if isinstance(values, basestring):
+        values = [values]
+      column_keep = np.zeros(len(self), dtype=bool)
+      for value in values:
+        column_keep |= getattr(self, column) == value
+      keep &= column_keep
+    if direction is not None:
+      keep &= self.direction == direction
+    if start is not None:
+      keep &= self.end >= start
+    if end is not None:
+      keep &= self.start <= end
+    return keep
+
+  def filter(self, site_type=None, direction=None, genome_name=None, start=None, end=None):
+    """
+    A new GffTable with only the rows that match all of the given values, see
+    mask
+    """
+
+    return self.take(self.mask(site_type, direction, genome_name, start, end))
+
+  def find_entry(self, findfunc, findall=False):
+    """
+    Same as GffData.find_entry
+    """
+
+    matches = filter(findfunc, self)
+
+    if len(matches) == 0:
+      return []
+
+    if (findall):
+      return matches
+    else:
+      return matches[0]
+
+  def write_gff_file(self, filename):
+    """
+    Write the current contents of the table to a file
+    """
+
+    ostr = open(filename, "w")
+
+    for line in self:
+      ostr.write("%s\n" % line)
+
+    ostr.close()
+
+
+def split_circular(starts, ends, genome_size, ids):
+  """
+  Split intervals that wrap around the origin into a piece at the end of the
+  genome and one at the start. Intervals that start off either end of the
+  genome are moved onto it first, and ones that cover it all become 1 to
+  genome_size. With no genome_size the intervals are returned as they are
+
+  Returns:
+    (starts, ends, ids) np.arrays of the pieces and the id of the interval
+    each came from
+
+  >>> split_circular(np.array([-2, 5, 8]), np.array([3, 6, 12]), 10, np.arange(3))
+  (array([8, 5, 8, 1, 1]), array([10,  6, 10,  3,  2]), array([0, 1, 2, 0, 2]))
+  """
+
+  if genome_size is None:
+    return starts, ends, ids
+  shift = (starts - 1) % genome_size + 1 - starts
+  starts = starts + shift
+  ends = ends + shift
+  whole = ends - starts + 1 >= genome_size
+  starts = np.where(whole, 1, starts)
+  ends = np.where(whole, genome_size, ends)
+  after = ends > genome_size
+  return (np.concatenate([starts, np.ones(after.sum(), dtype=np.int64)]),
+          np.concatenate([np.minimum(ends, genome_size), ends[after] - genome_size]),
+          np.concatenate([ids, ids[after]]))
+
+
+class GffIntervalIndex(object):
+  """
+  Static index of the intervals of gff features, for finding the features
+  that overlap or contain many positions or intervals at once. Coordinates
+  are 1-based and inclusive, as in gff files. With a genome_size, features
+  and queries can wrap around the origin, either by ending past the end of
+  the genome or, for features, by starting after they end
+
+  The pieces of the features are grouped by length, to the nearest power of
+  two, and each group is sorted by start. The pieces of a group that can
+  overlap a query are then a contiguous run found by two binary searches,
+  and as none of them are much longer than the rest, few of that run end
+  before the query starts. One long feature, like the region row of the
+  whole chromosome, only adds itself to every query
+
+  >>> index = GffIntervalIndex([10, 40, 95], [50, 45, 105], genome_size=100)
+  >>> index.query([42, 3, 60]) 
+  (array([0, 0, 1]), array([0, 1, 2]))
+  >>> index.count([90, 45], [110, 46])
+  array([2, 2])
+  >>> index.query([41], [44], contained=True)
+  (array([0, 0]), array([0, 1]))
+  """
+
+  def __init__(self, starts, ends, genome_size=None):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    self.genome_size = genome_size
+    self.feature_starts = starts
+    self.feature_ends = ends
+    features = np.arange(len(starts))
+    if genome_size is not None:
+      ends = np.where(starts > ends, ends + genome_size, ends)
+    starts, ends, features = split_circular(starts, ends, genome_size, features)
+    # a piece ends at or after a query starts if it starts no more than its
+    # reach before the query
+    reach = np.maximum(ends - starts, 0)
+    length_class = np.frexp(reach)[1]
+    # (starts, ends, features, longest reach) of each group of pieces
+    self.groups = []
+    for group in np.unique(length_class):
+      pieces = np.flatnonzero(length_class == group)
+      pieces = pieces[np.argsort(starts[pieces], kind="mergesort")]
+      self.groups.append((starts[pieces], ends[pieces], features[pieces],
+                          reach[pieces].max()))
+
+  @classmethod
+  def from_gff(cls, gffs, genome_size=None):
+    """
+    Index every entry of a GffData or GffTable. Feature numbers in query
+    results are the positions of the entries in gffs
+    """
+
+    if isinstance(gffs, GffTable):
+      return cls(gffs.start, gffs.end, genome_size)
+    entries = list(gffs)
+    return cls([entry.start for entry in entries], [entry.end for entry in entries], genome_size)
+
+  def query(self, starts, ends=None, contained=False):
+    """
+    Find the features that overlap each query interval, or contain it if
+    contained is True. Without ends, the queries are single positions
+
+    Returns:
+      (query_indices, feature_indices) np.arrays of each matching pair, sorted
+      by query and then feature
+    """
+
+    starts = np.atleast_1d(np.asarray(starts, dtype=np.int64))
+    if ends is None:
+      ends = starts
+    ends = np.atleast_1d(np.asarray(ends, dtype=np.int64))
+    starts, ends, queries = split_circular(starts, ends, self.genome_size, np.arange(len(starts)))
+    nfeatures = max(len(self.feature_starts), 1)
+    found = [np.zeros(0, dtype=np.int64)]
+    for group_starts, group_ends, group_features, reach in self.groups:
+      # pieces of the group before lo end before the query starts, and
+      # pieces from hi on start after it ends
+      lo = np.searchsorted(group_starts, starts - reach, "left")
+      hi = np.searchsorted(group_starts, ends, "right")
+      counts = np.maximum(hi - lo, 0)
+      query_pieces = np.repeat(np.arange(len(starts)), counts)
+      pieces = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+      if contained:
+        match = ((group_starts[pieces] <= starts[query_pieces]) &
+                 (group_ends[pieces] >= ends[query_pieces]))
+      else:
+        match = group_ends[pieces] >= starts[query_pieces]
+      found.append(queries[query_pieces[match]]*nfeatures + group_features[pieces[match]])
+    pairs, matched = np.unique(np.concatenate(found), return_counts=True)
+    if contained:
+      # a feature only contains a query that wraps around the origin if it
+      # contains both pieces of it
+      pairs = pairs[matched == np.bincount(queries)[pairs // nfeatures]]
+    return pairs // nfeatures, pairs % nfeatures
+
+  def count(self, starts, ends=None, contained=False):
+    """
+    Number of features that overlap, or contain, each query, see query
+    """
+
+    nqueries = len(np.atleast_1d(starts))
+    query_indices, feature_indices = self.query(starts, ends, contained)
+    return np.bincount(query_indices, minlength=nqueries)
+
+
+def _interval_pieces(starts, ends, genome_size):
+  """
+  Sorted, disjoint and non-adjacent pieces covering the same bases as the
+  intervals, all inside the genome when there is a genome_size. Intervals
+  that start after they end wrap around the origin
+  """
+
+  starts = np.atleast_1d(np.asarray(starts, dtype=np.int64))
+  ends = np.atleast_1d(np.asarray(ends, dtype=np.int64))
+  if genome_size is not None:
+    ends = np.where(starts > ends, ends + genome_size, ends)
+  starts, ends, ids = split_circular(starts, ends, genome_size, np.arange(len(starts)))
+  keep = starts <= ends
+  order = np.argsort(starts[keep], kind="mergesort")
+  starts = starts[keep][order]
+  ends = ends[keep][order]
+  if len(starts) == 0:
+    return starts, ends
+  # sweep along the genome, starting a new piece at every interval that
+  # starts past the end of everything before it
+  reach = np.maximum.accumulate(ends)
+  new = np.concatenate([[True], starts[1:] > reach[:-1] + 1])
+  return starts[new], reach[np.concatenate([np.flatnonzero(new)[1:] - 1, [len(ends) - 1]])]
+
+
+def _join_origin(starts, ends, genome_size):
+  """
+  Join the pieces at either end of the genome back into one interval that
+  wraps around the origin, ending past genome_size
+  """
+
+  if (genome_size is not None and len(starts) > 1 and starts[0] == 1 and
+      ends[-1] == genome_size):
+    ends = np.concatenate([ends[1:-1], [genome_size + ends[0]]])
+    starts = starts[1:]
+  return starts, ends
+
+
+def merge_intervals(starts, ends, genome_size=None):
+  """
+  Union of intervals as the fewest sorted, non-overlapping intervals covering
+  the same bases. Coordinates are 1-based and inclusive. With a genome_size
+  intervals can wrap around the origin, and an interval in the result that
+  does ends past genome_size
+
+  >>> merge_intervals([5, 1, 8, 20], [9, 3, 12, 22])
+  (array([ 1,  5, 20]), array([ 3, 12, 22]))
+  >>> merge_intervals([18, 5, 1], [22, 9, 3], genome_size=20)
+  (array([ 5, 18]), array([ 9, 23]))
+  """
+
+  starts, ends = _interval_pieces(starts, ends, genome_size)
+  return _join_origin(starts, ends, genome_size)
+
+
+def intersect_intervals(starts, ends, other_starts, other_ends, genome_size=None):
+  """
+  Bases in both sets of intervals, as merged intervals, see merge_intervals
+
+  >>> intersect_intervals([1, 10], [6, 20], [5, 12], [11, 15])
+  (array([ 5, 10]), array([ 6, 15]))
+  >>> intersect_intervals([15], [25], [1], [8], genome_size=20)
+  (array([1]), array([5]))
+  """
+
+  starts, ends = _interval_pieces(starts, ends, genome_size)
+  other_starts, other_ends = _interval_pieces(other_starts, other_ends, genome_size)
+  # other pieces before lo end before the piece starts and those from hi on
+  # start after it ends
+  lo = np.searchsorted(other_ends, starts, "left")
+  hi = np.searchsorted(other_starts, ends, "right")
+  counts = np.maximum(hi - lo, 0)
+  pieces = np.repeat(np.arange(len(starts)), counts)
+  others = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+  return _join_origin(np.maximum(starts[pieces], other_starts[others]),
+                      np.minimum(ends[pieces], other_ends[others]), genome_size)
+
+
+def _gaps(starts, ends, bound):
+  """
+  Pieces of 1 to bound between pieces from _interval_pieces
+  """
+
+  gap_starts = np.concatenate([[1], ends + 1])
+  gap_ends = np.concatenate([starts - 1, [bound]])
+  keep = gap_starts <= gap_ends
+  return gap_starts[keep], gap_ends[keep]
+
+
+def complement_intervals(starts, ends, genome_size):
+  """
+  Bases of the genome not in any of the intervals, as merged intervals, see
+  merge_intervals
+
+  >>> complement_intervals([3, 10], [5, 18], 20)
+  (array([ 6, 19]), array([ 9, 22]))
+  """
+
+  starts, ends = _interval_pieces(starts, ends, genome_size)
+  gap_starts, gap_ends = _gaps(starts, ends, genome_size)
+  return _join_origin(gap_starts, gap_ends, genome_size)
+
+
+def subtract_intervals(starts, ends, other_starts, other_ends, genome_size=None):
+  """
+  Bases in the first set of intervals but not the other, as merged intervals,
+  see merge_intervals
+
+  >>> subtract_intervals([1, 30], [20, 40], [5, 35], [8, 50])
+  (array([ 1,  9, 30]), array([ 4, 20, 34]))
+  >>> subtract_intervals([15], [25], [3], [16], genome_size=20)
+  (array([17]), array([22]))
+  """
+
+  bound = genome_size
+  if bound is None:
+    # nothing past the end of the intervals matters
+    bound = max(np.max(ends, initial=0), np.max(other_ends, initial=0))
+  other_starts, other_ends = _interval_pieces(other_starts, other_ends, genome_size)
+  other_starts, other_ends = _gaps(other_starts, other_ends, bound)
+  return intersect_intervals(starts, ends, other_starts, other_ends, genome_size)
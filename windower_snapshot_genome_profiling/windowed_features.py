@@ -30,27 +30,32 @@ from windowtools import *
 import sys
 import numpy as np
 import argparse
-import shlex
+import os
+import hashlib
+import itertools
+import multiprocessing
 import regex
+import fasta
+import gfftools
 
-def newSplit(value):
-    lex = shlex.shlex(value)
-    lex.quotes = '"'
-    lex.whitespace_split = True
-    lex.commenters = ''
-    return list(lex)
+# summary stats that can be calculated from cumulative sums of the signal and
+# the PrefixSumSignal method that does it
+PREFIX_SUM_STATS = {'mean': 'mean', 'density': 'count'}
+# types tracks can be stored as with --dtype
+TRACK_DTYPES = {'float64': np.float64, 'float32': np.float32,
+                'int32': np.int32, 'bool': np.bool_}
+# number of sliding windows to calculate at a time
+SLIDING_CHUNK_SIZE = 100000
+# file extensions read as a genome sequence
+FASTA_EXTENSIONS = (".fa", ".fasta", ".fna")
+# summary stats, other than the genomic features, that work on sequence
+SEQUENCE_STATS = ['density']
+# number of random windows for --distributions in each shard. Every shard
+# has its own random stream so the background doesn't depend on --workers
+RANDOM_SHARD_SIZE = 100000
 
 def make_comment_dict(gff_entry):
-    gff_entry.comment_dict = {}
-    keyvalue = gff_entry.comments.split(";")
-    for pair in keyvalue:
-        key_value= newSplit(pair)
-        key = key_value[0]
-        if len(key_value) != 2:
-            value = ""
-        else:
-            value = key_value[1]
-        gff_entry.comment_dict[key] = value
+    gff_entry.comment_dict = gfftools.parse_attributes(gff_entry.comments)
 
 def parse_genomic_feature_type(args_list):
     if args_list is None:
@@ -60,15 +65,22 @@ def parse_genomic_feature_type(args_list):
     if featype == "motif":
         motif= regex.compile(arg)
         return lambda x: motif_count_window(x, motif)
+    elif featype == "motifhits":
+        motif= regex.compile(arg)
+        return lambda x: motif_hits_window(x, motif)
     elif featype == "basecontent":
         bases = arg.split(";")
         return lambda x: base_content_window(x, bases=bases)
+    elif featype == "kmers":
+        raise ValueError("--genomic_feature kmers gives a column for each k-mer, see kmer_stat_names")
     else:
         raise ValueError("genomic feature %s is not a valid option"%featype)
 
 def parse_entry_for_name(gff_entry):
-    make_comment_dict(gff_entry)
-    return (str(gff_entry.comment_dict["Gene"])+"\t"+str(gff_entry.comment_dict["Synonym"]))
+    # rows of a GffTable parse their comments when they're first asked for
+    if not hasattr(gff_entry, "comment_dict"):
+        make_comment_dict(gff_entry)
+    return (gff_entry.comment_dict["Gene"], gff_entry.comment_dict["Synonym"])
 
 
 def base_content_window(window_signal, bases=["A", "T"]):
@@ -86,6 +98,16 @@ def base_content_window(window_signal, bases=["A", "T"]):
         total += window_signal.count(base)
     return total/(divisor + 0.0)
 
+def base_content_windows(kmer_counts, bases, starts, ends):
+    """
+    base_content_window for np.arrays of 1-based inclusive window starts and
+    ends, from a KmerCounts of the genome. Empty windows are nan.
+    """
+    total = sum(kmer_counts.count(base, starts, ends) for base in bases)
+    divisor = kmer_counts.lengths(starts, ends)/len(bases[0])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total/(divisor + 0.0)
+
 def motif_count_window(window_signal, motif):
     """ 
     Given a sequence, return the count of motifs in the sequence
@@ -101,12 +123,531 @@ def motif_count_window(window_signal, motif):
     else:
         return 0
 
+def motif_hits_window(window_signal, motif):
+    """
+    Given a sequence, return the count of motifs on either strand of the
+    sequence, including overlapping ones
+
+    >>> motif_hits_window("GATCGA", regex.compile("GA"))
+    3
+    """
+    return (len(regex.findall(motif, window_signal, overlapped=True)) +
+            len(regex.findall(motif, fasta.complement(window_signal)[::-1],
+                              overlapped=True)))
+
+def kmer_stat_names(k):
+    """
+    Summary stat names for the frequency of every k-mer of length k, which
+    is what --genomic_feature kmers k asks for
+
+    >>> kmer_stat_names(1)
+    ['kmer:A', 'kmer:C', 'kmer:G', 'kmer:T']
+    """
+    return ["kmer:" + "".join(kmer) for kmer in itertools.product("ACGT", repeat=int(k))]
+
+def kmer_frequency_window(window_signal, kmer):
+    """
+    Given a sequence, return the fraction of the places a k-mer could start
+    that kmer starts at, counting overlapping ones
+
+    >>> kmer_frequency_window("AAAT", "AA")
+    0.6666666666666666
+    """
+    places = len(window_signal) - len(kmer) + 1
+    if places <= 0:
+        return np.nan
+    return len(regex.findall(regex.escape(kmer), window_signal, overlapped=True))/(places + 0.0)
+
 def any_over_cutoff(window_signal, cutoff=1):
     return np.sum(window_signal > cutoff) > 0
 
 
-def parse_bed_into_array(infile, genome_length):
-    array = np.zeros(genome_length)
+def quantile_of(stat_name):
+    """
+    Percentile a --summary_stat name asks for, None if it isn't a quantile
+
+    >>> quantile_of("median"), quantile_of("q90"), quantile_of("mean")
+    (50.0, 90.0, None)
+    """
+    if stat_name == "median":
+        return 50.0
+    if stat_name.startswith("q"):
+        try:
+            quantile = float(stat_name[1:])
+        except ValueError:
+            return None
+        if 0 <= quantile <= 100:
+            return quantile
+    return None
+
+def parse_summary_stat(stat_name, genomic_feature):
+    """
+    Turn a single --summary_stat name into a function of the signal in a
+    window
+    """
+    summary_stat = {'mean': np.mean, 'median': np.median, 'density': lambda x: len(x),
+                    'min': lambda x: np.min(x) if len(x) else np.nan,
+                    'max': lambda x: np.max(x) if len(x) else np.nan,
+                    'std': np.std}
+    if stat_name in summary_stat.keys():
+        return summary_stat[stat_name]
+    elif stat_name == "genomic":
+        return parse_genomic_feature_type(genomic_feature)
+    elif stat_name.startswith("kmer:"):
+        kmer = stat_name[len("kmer:"):]
+        return lambda x: kmer_frequency_window(x, kmer)
+    elif quantile_of(stat_name) is not None:
+        quantile = quantile_of(stat_name)
+        return lambda x: window_quantiles(np.asarray(x), [quantile])[0]
+    else:
+        try:
+            cutoff = float(stat_name)
+        except:
+            print "Error interpreting number for cutoff summary stat %s"%stat_name
+            raise
+        return lambda x : any_over_cutoff(x, cutoff)
+
+def pyramid_stat(stat_name):
+    """
+    Function that gives a --summary_stat from the window summaries of a
+    SummaryPyramid, None if it can't be found from them
+
+    >>> summaries = {"sum": np.array([6.]), "count": np.array([3.]),
+    ...              "sumsq": np.array([14.]), "max": np.array([3.])}
+    >>> pyramid_stat("mean")(summaries), pyramid_stat("0.5")(summaries)
+    (array([2.]), array([1.]))
+    >>> pyramid_stat("median") is None
+    True
+    """
+    def mean(summaries):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return summaries["sum"]/summaries["count"]
+
+    def std(summaries):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            variance = summaries["sumsq"]/summaries["count"] - mean(summaries)**2
+        return np.sqrt(np.maximum(variance, 0))
+
+    stats = {'mean': mean, 'density': lambda summaries: summaries["count"],
+             'min': lambda summaries: summaries["min"],
+             'max': lambda summaries: summaries["max"], 'std': std}
+    if stat_name in stats:
+        return stats[stat_name]
+    try:
+        cutoff = float(stat_name)
+    except ValueError:
+        return None
+
+    def over_cutoff(summaries):
+        # empty windows have a nan max, which is never over the cutoff
+        with np.errstate(invalid="ignore"):
+            return (summaries["max"] > cutoff).astype(float)
+    return over_cutoff
+
+def stat_label(stat_name):
+    """
+    Label for the block of columns of a summary stat
+
+    >>> stat_label("median"), stat_label("0.5"), stat_label("kmer:GC")
+    ('median', 'cutoff0.5', 'GC')
+    """
+    if stat_name.startswith("kmer:"):
+        return stat_name[len("kmer:"):]
+    try:
+        float(stat_name)
+    except ValueError:
+        return stat_name
+    return "cutoff%s"%stat_name
+
+def window_stat_arrays(summary_stats, quantiles, window_signal, data, starts,
+                       ends, genome_size):
+    """
+    Pull the signal in each window out once and apply each of summary_stats
+    to it, one window at a time. All of the quantiles come from a single
+    partial sort of each window.
+
+    starts and ends are np.arrays of 1-based inclusive window coordinates.
+    Returns a list with a np.array of the value in each window for each
+    summary stat, followed by one for each quantile
+    """
+    if window_signal is complex_window_signal_circular:
+        signals = complex_window_signals(data, starts, ends, genome_size)
+    elif window_signal is pull_chrm_seq:
+        signals = data.pull_seqs(starts - 1, ends)
+    else:
+        signals = (window_signal(data, window, genome_size)
+                   for window in zip(starts.tolist(), ends.tolist()))
+    values = []
+    for signal in signals:
+        row = [summary_stat(signal) for summary_stat in summary_stats]
+        if quantiles:
+            row.extend(window_quantiles(signal, quantiles))
+        values.append(row)
+    values = np.array(values, dtype=float).reshape(len(starts), len(summary_stats) + len(quantiles))
+    return list(values.T)
+
+def make_window_stats(args, data, window_signal, sliding=False, nstats=None):
+    """
+    Pick the fastest way to calculate every one of args.summary_stats for
+    the data, sharing work between them where possible: mean and density
+    both come from one set of cumulative sums, quantiles (median, qN) all
+    come from the same sorted window, motifhits come from a MotifHitIndex of
+    the genome, basecontent and k-mer frequencies come from KmerCounts of
+    the genome and any other stats are applied to the same slice of the
+    signal. sliding should be True when the windows slide
+    along the genome in order. nstats limits it to the first nstats summary
+    stats.
+
+    Returns a function that takes np.arrays of 1-based inclusive window
+    starts and ends and returns a list with a np.array of the value in each
+    window for each summary stat
+    """
+    stat_names = args.stat_names[:nstats]
+    if isinstance(data, SummaryPyramid):
+        return pyramid_window_stats(data, stat_names)
+    prefix_stats = []
+    quantile_stats = []
+    motif_stats = []
+    kmer_stats = {}
+    other_stats = []
+    for i, stat_name in enumerate(stat_names):
+        if isinstance(data, np.ndarray) and stat_name in PREFIX_SUM_STATS:
+            prefix_stats.append(i)
+        elif isinstance(data, np.ndarray) and quantile_of(stat_name) is not None:
+            quantile_stats.append(i)
+        elif stat_name == "genomic" and args.genomic_feature[0] == "motifhits":
+            motif_stats.append(i)
+        elif stat_name.startswith("kmer:"):
+            kmer_stats[i] = [stat_name[len("kmer:"):]]
+        elif (stat_name == "genomic" and args.genomic_feature[0] == "basecontent" and
+              not any(kmer_has_border(bases) for bases in args.genomic_feature[1].split(";"))):
+            # str.count only counts occurrences that don't overlap, which
+            # is the same as counting them all unless they can overlap
+            kmer_stats[i] = args.genomic_feature[1].split(";")
+        else:
+            other_stats.append(i)
+    if motif_stats:
+        motif_hits = MotifHitIndex(data.seq, regex.compile(args.genomic_feature[1]))
+    if kmer_stats:
+        kmer_counts = KmerCounts(data.seq, itertools.chain(*kmer_stats.values()))
+    quantiles = [quantile_of(stat_names[i]) for i in quantile_stats]
+    other_funcs = [args.summary_stats[i] for i in other_stats]
+    if prefix_stats:
+        prefix_sums = PrefixSumSignal(data, args.genome_length)
+    rolling = False
+    if sliding and quantile_stats:
+        signal = data[:,1] if len(data.shape) > 1 else data
+        rolling = not np.isnan(signal).any()
+
+    def window_stats(starts, ends):
+        values = [None]*len(stat_names)
+        for i in prefix_stats:
+            values[i] = getattr(prefix_sums, PREFIX_SUM_STATS[stat_names[i]])(starts, ends)
+        for i in motif_stats:
+            values[i] = motif_hits.count(starts, ends)
+        for i, kmers in kmer_stats.items():
+            if stat_names[i].startswith("kmer:"):
+                values[i] = kmer_counts.frequencies(kmers, starts, ends)[:,0]
+            else:
+                values[i] = base_content_windows(kmer_counts, kmers, starts, ends)
+        if rolling:
+            quantile_values = rolling_window_quantiles(data, starts, ends,
+                                                       args.genome_length,
+                                                       quantiles)
+            sliced_quantiles = []
+        else:
+            quantile_values = []
+            sliced_quantiles = quantiles
+        if other_stats or sliced_quantiles:
+            sliced = window_stat_arrays(other_funcs, sliced_quantiles,
+                                        window_signal, data, starts, ends,
+                                        args.genome_length)
+            quantile_values = quantile_values + sliced[len(other_funcs):]
+            for i, stat_values in zip(other_stats, sliced):
+                values[i] = stat_values
+        for i, stat_values in zip(quantile_stats, quantile_values):
+            values[i] = stat_values
+        return values
+    return window_stats
+
+def pyramid_window_stats(pyramid, stat_names):
+    """
+    make_window_stats for a SummaryPyramid. Every stat comes from the same
+    window summaries.
+    """
+    stats = [pyramid_stat(stat_name) for stat_name in stat_names]
+    for stat_name, stat in zip(stat_names, stats):
+        if stat is None:
+            raise ValueError("--summary_stat %s can't be calculated from a summary pyramid"%stat_name)
+
+    def window_stats(starts, ends):
+        summaries = pyramid.window_summaries(starts, ends)
+        return [stat(summaries) for stat in stats]
+    return window_stats
+
+def stat_blocks(window_stats, column_windows):
+    """
+    Calculate every summary stat for every output column.
+
+    window_stats - function from make_window_stats
+    column_windows - list of (starts, ends) np.arrays for each output column
+    Returns a list of the np.array of values for each column, in a block of
+    columns for each summary stat
+    """
+    column_stats = [window_stats(starts, ends) for starts, ends in column_windows]
+    return [stats[stat] for stat in xrange(len(column_stats[0]))
+            for stats in column_stats]
+
+def worker_pool(workers, initializer, initargs):
+    """
+    Start a multiprocessing.Pool of workers processes, each set up by
+    calling initializer with initargs. With a single worker no pool is
+    started, initializer is called in this process and None is returned
+    """
+    if workers <= 1:
+        initializer(*initargs)
+        return None
+    # workers are forked so they share the track instead of copying it
+    return multiprocessing.Pool(workers, initializer, initargs)
+
+def init_sliding_worker(window_stats, column_windows):
+    """
+    Set up the state sliding_chunk_values needs. Run once in each worker
+    process (or in the main process when not using workers)
+
+    window_stats - list of functions from make_window_stats, one per track
+    column_windows - (start, end) of each output column for the window
+                     (1, size), in output order
+    """
+    global sliding_worker_state
+    sliding_worker_state = (window_stats, column_windows)
+
+def sliding_chunk_values(window_starts):
+    """
+    Calculate every output column of every track for a chunk of sliding
+    windows.
+
+    window_starts - np.array of 1-based starts of the sliding windows
+    Returns a (windows x columns) np.array of values, a block of columns
+    for each track and within that for each summary stat
+    """
+    window_stats, column_windows = sliding_worker_state
+    chunk_windows = [(window_starts + start - 1, window_starts + end - 1)
+                     for start, end in column_windows]
+    return np.column_stack([values for track_stats in window_stats
+                            for values in stat_blocks(track_stats, chunk_windows)])
+
+def track_labels(infiles):
+    """
+    Short names for each input file to label its block of columns with.
+    Uses the file name without its extension, or track0, track1... if those
+    aren't unique.
+
+    >>> track_labels(["data/rna.gr", "data/dna.npy"])
+    ['rna', 'dna']
+    >>> track_labels(["a/rna.gr", "b/rna.gr"])
+    ['track0', 'track1']
+    """
+    labels = [os.path.splitext(os.path.basename(infile))[0] for infile in infiles]
+    if len(set(labels)) != len(labels):
+        labels = ["track%i"%i for i in xrange(len(infiles))]
+    return labels
+
+def window_column_names(args):
+    """
+    Names of the value columns in the order window_columns lays them out.
+    With more than one summary stat each stat gets a block of these columns
+    prefixed with its stat_label, and with more than one input track each
+    track gets a block of those prefixed with its label from track_labels.
+    """
+    column_names = []
+    if args.far_upstream > 0:
+        for i in xrange(0,args.far_upstream_bins):
+            column_names.append("upstream_window_%i"%i)
+    for i in xrange(0,args.window_bins):
+        column_names.append("window_%i"%i)
+    if args.far_downstream > 0:
+        for i in xrange(0, args.far_downstream_bins):
+            column_names.append("downstream_window_%i"%i)
+    if len(args.stat_names) > 1:
+        column_names = ["%s_%s"%(stat_label(stat_name), name)
+                        for stat_name in args.stat_names
+                        for name in column_names]
+    if len(args.input_data) > 1:
+        column_names = ["%s_%s"%(label, name)
+                        for label in track_labels(args.input_data)
+                        for name in column_names]
+    return column_names
+
+class TextWindowWriter(object):
+    """
+    Writes windows as tab delimited text with a header line. Each block of
+    rows is formatted with a single string formatting operation.
+
+    Inputs:
+        outf - file handle to write to
+        column_names - names of every column, name columns first
+    """
+
+    def __init__(self, outf, column_names):
+        self.outf = outf
+        self.column_names = column_names
+        outf.write("\t".join(column_names) + "\n")
+
+    def write_block(self, name_columns, values):
+        """
+        Write a block of windows.
+
+        Inputs:
+            name_columns - list of sequences, one for each column that names
+                           the windows
+            values - (windows x columns) np.array of the window values
+        """
+        nrows = len(values)
+        if nrows == 0:
+            return
+        row_format = "\t".join(["%s"]*len(name_columns) +
+                               ["%0.4e"]*values.shape[1]) + "\n"
+        columns = [np.asarray(column).tolist() for column in name_columns]
+        rows = zip(*(columns + values.T.tolist()))
+        self.outf.write((row_format*nrows)%tuple(itertools.chain.from_iterable(rows)))
+
+    def close(self):
+        if self.outf is not sys.stdout:
+            self.outf.close()
+
+class NpyWindowWriter(object):
+    """
+    Writes windows to a .npy file as a structured array with a field for
+    each column of the text output. Blocks are appended to the file as they
+    come in so the whole output never has to be held in memory, which means
+    the number of rows has to be known up front. String name columns are as
+    wide as the longest string in the first block.
+
+    Inputs:
+        fname - file to write to
+        column_names - names of every column, name columns first
+        nrows - total number of windows that will be written
+    """
+
+    def __init__(self, fname, column_names, nrows):
+        self.fhandle = open(fname, "wb")
+        self.column_names = column_names
+        self.nrows = nrows
+        self.dtype = None
+        self.written = 0
+
+    def write_block(self, name_columns, values):
+        """
+        See TextWindowWriter.write_block
+        """
+        name_columns = [np.asarray(column) for column in name_columns]
+        if self.dtype is None:
+            value_names = self.column_names[len(name_columns):]
+            self.dtype = np.dtype([(name, column.dtype) for name, column in
+                                   zip(self.column_names, name_columns)] +
+                                  [(name, values.dtype) for name in value_names])
+            np.lib.format.write_array_header_1_0(self.fhandle,
+                    {"descr": np.lib.format.dtype_to_descr(self.dtype),
+                     "fortran_order": False, "shape": (self.nrows,)})
+        block = np.empty(len(values), dtype=self.dtype)
+        for name, column in zip(self.column_names, name_columns + list(values.T)):
+            block[name] = column
+        self.fhandle.write(block.tobytes())
+        self.written += len(block)
+
+    def close(self):
+        if self.dtype is None:
+            self.write_block([], np.empty((0, len(self.column_names))))
+        self.fhandle.close()
+        if self.written != self.nrows:
+            raise ValueError("wrote %s windows but expected %s"%(self.written, self.nrows))
+
+class NpzWindowWriter(object):
+    """
+    Writes windows to a .npz file with an array for each column of the text
+    output. Blocks are collected and the file is written on close.
+
+    Inputs:
+        fname - file to write to
+        column_names - names of every column, name columns first
+    """
+
+    def __init__(self, fname, column_names):
+        self.fname = fname
+        self.column_names = column_names
+        self.blocks = [[] for name in column_names]
+
+    def write_block(self, name_columns, values):
+        """
+        See TextWindowWriter.write_block
+        """
+        columns = [np.asarray(column) for column in name_columns] + list(values.T)
+        for block, column in zip(self.blocks, columns):
+            block.append(column)
+
+    def close(self):
+        np.savez(self.fname, **dict((name, np.concatenate(block) if block else np.array([]))
+                                    for name, block in zip(self.column_names, self.blocks)))
+
+def make_annotator(args):
+    """
+    Columns --landmarks and --nearest_gff add after the name columns.
+
+    Returns a tuple (column_names, annotate) where annotate takes np.arrays
+    of 1-based inclusive window starts and ends and returns a list with a
+    np.array for each column, worked out for the 0-based center of each
+    window like --name center
+    """
+    column_names = []
+    annotations = []
+    if args.landmarks:
+        ter = args.ter
+        if ter is None:
+            ter = (args.oriC + args.genome_length//2) % args.genome_length
+        column_names.extend(["oriC_distance", "ter_distance"])
+        annotations.append(lambda centers: [
+            circular_distance(centers, args.oriC, args.genome_length),
+            circular_distance(centers, ter, args.genome_length)])
+    if args.nearest_gff:
+        gffs = read_gff_table(args.nearest_gff, make_parse_cache(args))
+        minus = gffs.direction == "-"
+        # 0-based like --name fiveprime
+        fiveprimes = np.where(minus, gffs.end, gffs.start) - 1
+        nearest_index = NearestFeatureIndex(fiveprimes, minus, args.genome_length)
+        def nearest(centers):
+            features, distances = nearest_index.nearest(centers)
+            return [fiveprimes[features], distances]
+        column_names.extend(["Nearest_fiveprime", "Nearest_distance"])
+        annotations.append(nearest)
+    def annotate(starts, ends):
+        # windows can run past either end of the genome
+        centers = ((starts + ends)/2.0 - 1).astype(int) % args.genome_length
+        return [column for annotation in annotations
+                for column in annotation(centers)]
+    return column_names, annotate
+
+def make_window_writer(args, column_names, nrows):
+    """
+    Make a writer for --output_format that writes to -o, or stdout for text
+    """
+    if args.output_format == "text":
+        if args.o:
+            outf = open(args.o, "w")
+        else:
+            outf = sys.stdout
+        return TextWindowWriter(outf, column_names)
+    if not args.o:
+        raise ValueError("-o must be specified for --output_format %s"%args.output_format)
+    if args.output_format == "npy":
+        return NpyWindowWriter(args.o, column_names, nrows)
+    elif args.output_format == "npz":
+        return NpzWindowWriter(args.o, column_names)
+    else:
+        raise ValueError("--output_format %s not supported"%args.output_format)
+
+def parse_bed_into_array(infile, genome_length, dtype=float):
+    array = np.zeros(genome_length, dtype=dtype)
     array[:] = np.nan
     with open(infile, mode="r") as f:
         for line in f:
@@ -116,13 +657,71 @@ def parse_bed_into_array(infile, genome_length):
             array[start:end] = float(linearr[4])
     return array
 
-def read_genome(infile):
+def convert_track_dtype(data, dtype):
+    """
+    Store a 1d signal or 2d [loc, signal] array as dtype. Integer and bool
+    tracks can't hold nans so any non-finite values become 0. Returns data
+    itself if it is already dtype, so memory mapped arrays stay mapped.
+
+    >>> convert_track_dtype(np.array([0.5, np.nan, 2.0]), np.int32)
+    array([0, 0, 2], dtype=int32)
+    >>> convert_track_dtype(np.array([0.0, 3.0]), np.bool_)
+    array([False,  True])
+    """
+    if dtype is None or data.dtype == dtype:
+        return data
+    dtype = np.dtype(dtype)
+    if len(data.shape) > 1:
+        if dtype.kind == "b":
+            raise ValueError("[loc, signal] data can't be stored as bool")
+        if dtype.kind == "f" and np.max(data[:,0]) >= 2**(np.finfo(dtype).nmant+1):
+            raise ValueError("locations are too large to store exactly as %s"%dtype)
+    if dtype.kind in "biu" and data.dtype.kind == "f":
+        data = np.where(np.isfinite(data), data, 0)
+    return data.astype(dtype)
+
+def clean_data(args, data):
+    """
+    Apply --no_finite, --no_truncate, --dtype and --convert_logical to the
+    data, in that order. Genomic data and summary pyramids, which are built
+    from cleaned data, are returned as is.
+
+    Returns the cleaned data, which is changed in place where possible
+    """
+    if args.genomic_feature is not None or isinstance(data, SummaryPyramid):
+        return data
+    if not args.no_finite:
+        data[~np.isfinite(data)] = 0
+    if not args.no_truncate:
+        data[data < 0 ] = 0
+    data = convert_track_dtype(data, TRACK_DTYPES.get(args.dtype))
+    if args.convert_logical:
+        if len(data.shape) > 1:
+            data[:,1] = data[:,1] > args.convert_logical
+        else:
+            data = data > args.convert_logical
+    return data
+
+def read_genome(infile, packed=False):
 #    sys.path.append("/home/mbwolfe/src/circ_mapper")
     import fasta
+    if packed:
+        # whole sequence is kept in memory, at 2 bits per base
+        genome = fasta.FastaFile(packed=True)
+        with open(infile) as fhandle:
+            genome.read_whole_file(fhandle)
+        return genome.pull_entry(genome.names[0])
     genome = fasta.FastaFile()
-    with open(infile, mode="r") as f:
-        genome.read_whole_file(f)
-    chrm=genome.pull_entry(genome.chrm_names()[0])
+    try:
+        # sequence is only read as windows are pulled from it. An existing
+        # .fai index is used but a new one isn't written next to the input
+        genome.read_indexed_file(infile, write_index=False)
+    except ValueError:
+        # lines of different lengths can't be indexed
+        genome = fasta.FastaFile()
+        with open(infile) as fhandle:
+            genome.read_whole_file(fhandle)
+    chrm=genome.pull_entry(genome.names[0])
     return chrm
 
 def pull_chrm_seq(chrm, window, genome_size, circ=True, rc=False):
@@ -131,238 +730,486 @@ def pull_chrm_seq(chrm, window, genome_size, circ=True, rc=False):
     return chrm.pull_seq(start, end, circ=circ, rc=rc)
 
 
-def parse_data_into_array(infile, genome_length):
+class ParseCache(object):
+    """
+    Directory of the arrays parsed out of text input files, so that later
+    runs on the same file load them instead of parsing it again. Files are
+    found by their path, size, modification time and the md5 of their
+    contents, along with anything else the parsing depends on. When the
+    directory grows past max_bytes the files that were used least recently
+    are removed.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def cache_file(self, infile, params):
+        """
+        File the arrays parsed from infile with params are cached in
+        """
+        content = hashlib.md5()
+        with open(infile, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), ""):
+                content.update(block)
+        key = repr((os.path.abspath(infile), os.path.getsize(infile),
+                    os.path.getmtime(infile), content.hexdigest(), params))
+        return os.path.join(self.directory, "%s.%s.npz"%(
+                            os.path.basename(infile), hashlib.md5(key).hexdigest()))
+
+    def load(self, infile, params, parse):
+        """
+        The dict of arrays parse() returns for infile, read from the cache
+        if it is there and saved to it otherwise
+        """
+        fname = self.cache_file(infile, params)
+        if os.path.exists(fname):
+            # mark it as recently used
+            os.utime(fname, None)
+            with np.load(fname) as cached:
+                return dict((name, cached[name]) for name in cached.files)
+        arrays = parse()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # write somewhere else first so a half written cache is never read
+        tmp_fname = "%s.%s.tmp.npz"%(fname[:-len(".npz")], os.getpid())
+        np.savez(tmp_fname, **arrays)
+        os.rename(tmp_fname, fname)
+        self.evict(keep=fname)
+        return arrays
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used files until the cache fits in
+        max_bytes, never removing keep
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            fname = os.path.join(self.directory, name)
+            if name.endswith(".tmp.npz") or not name.endswith(".npz") or fname == keep:
+                continue
+            try:
+                stat = os.stat(fname)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, fname))
+        total = sum(size for mtime, size, fname in files)
+        if keep is not None:
+            total += os.path.getsize(keep)
+        for mtime, size, fname in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                # another run may have removed it already
+                pass
+            total -= size
+
+def make_parse_cache(args):
+    """
+    ParseCache for --parse_cache, None if it isn't given
+    """
+    if not args.parse_cache:
+        return None
+    return ParseCache(args.parse_cache, args.parse_cache_size*2**20)
+
+def read_gff_table(infile, cache=None):
+    """
+    Parse a .gff file into a GffTable, through cache if it is given
+    """
+    gffs = gfftools.GffTable()
+    if cache is None:
+        gffs.parse_gff_file(infile)
+        return gffs
+    def parse():
+        gffs.parse_gff_file(infile)
+        return gffs.to_arrays()
+    return gfftools.GffTable.from_arrays(cache.load(infile, "gff", parse))
+
+def parse_data_into_array(infile, genome_length, dtype=None, mmap=False, cache=None,
+                          packed=False):
+    """
+    Read a track or genome from infile. dtype is the np.dtype to store .bed
+    tracks as, if it is a float type. If mmap is True, .npy files are memory
+    mapped copy-on-write instead of being read into memory. If a ParseCache
+    is given .gr and .bed files are only parsed the first time they are read.
+    If packed is True a fasta genome is held in memory as a PackedFastaEntry.
+
+    Returns (data, window_signal) where window_signal is the function to
+    pull the data in a window out of data
+    """
     infile_name = infile.lower()
     if infile_name.endswith(".gr"):
-        return np.loadtxt(infile), complex_window_signal_circular
+        parse = lambda: {"data": np.loadtxt(infile)}
+        if cache is not None:
+            return cache.load(infile, "gr", parse)["data"], complex_window_signal_circular
+        return parse()["data"], complex_window_signal_circular
     elif infile_name.endswith(".bed"):
-        return parse_bed_into_array(infile, genome_length), simple_window_signal_circular
-    elif infile_name.endswith(".fa") or infile_name.endswith(".fasta") or infile_name.endswith(".fna"):
-        return read_genome(infile), pull_chrm_seq
+        if dtype is None or np.dtype(dtype).kind != "f":
+            dtype = float
+        parse = lambda: {"data": parse_bed_into_array(infile, genome_length, dtype)}
+        if cache is not None:
+            return (cache.load(infile, ("bed", genome_length, np.dtype(dtype).str), parse)["data"],
+                    simple_window_signal_circular)
+        return parse()["data"], simple_window_signal_circular
+    elif infile_name.endswith(FASTA_EXTENSIONS):
+        return read_genome(infile, packed), pull_chrm_seq
     elif infile.lower().endswith(".npy"):
-        data = np.load(infile)
+        if mmap:
+            data = np.load(infile, mmap_mode="c")
+        else:
+            data = np.load(infile)
         if len(data.shape) > 1:
             return data, complex_window_signal_circular
         else:
             return data, simple_window_signal_circular
+    elif infile_name.endswith(".npz"):
+        pyramid = SummaryPyramid.load(infile)
+        if pyramid.genome_size != genome_length:
+            raise ValueError("%s was built for a genome of length %s"%(infile, pyramid.genome_size))
+        # only the summaries of windows can be found from a pyramid
+        return pyramid, None
     else:
         raise ValueError("%s file types not supported"%infile)
 
-def sliding_window_main(args):
+def load_track(args, infile, max_window=None):
+    """
+    Read and clean a track. Dense tracks are padded so that windows up to
+    max_window long are views of the track (see CircularSignal).
 
-    data, window_signal = parse_data_into_array(args.input_data, args.genome_length)
-    if args.genomic_feature is None:
-        if not args.no_finite:
-            data[~np.isfinite(data)] = 0
-        if not args.no_truncate:
-            data[data < 0 ] = 0
-        if args.convert_logical:
-            if len(data.shape) > 1:
-                data[:,1] = data[:,1] > args.convert_logical
-            else:
-                data = data > args.convert_logical
+    Returns (data, window_signal)
+    """
+    data, window_signal = parse_data_into_array(infile, args.genome_length,
+                                                TRACK_DTYPES.get(args.dtype),
+                                                args.mmap, make_parse_cache(args),
+                                                args.packed_genome)
+    data = clean_data(args, data)
+    if (max_window and window_signal is simple_window_signal_circular and
+            not isinstance(data, np.memmap)):
+        # padding would copy a memory mapped track into memory
+        track = CircularSignal(data, args.genome_length, max_window)
+        data, window_signal = track.signal, track.window_signal
+    return data, window_signal
 
-    summary_stat = args.summary_stat
+def pyramid_main(args):
+    """
+    Build a SummaryPyramid of a cleaned track and save it, to be windowed
+    later by giving the .npz file as input data.
+    """
+    data, window_signal = parse_data_into_array(args.input_data, args.genome_length,
+                                                TRACK_DTYPES.get(args.dtype),
+                                                args.mmap, make_parse_cache(args))
+    if window_signal not in (simple_window_signal_circular, complex_window_signal_circular):
+        raise ValueError("can only build a summary pyramid of a .gr, .bed or .npy track")
+    data = clean_data(args, data)
+    SummaryPyramid.from_data(data, args.genome_length, args.factor).save(args.outfile)
+
+def sliding_window_main(args):
     direction="+"
-    # determine where to write out to
-    if args.o:
-        outf = open(args.o, "w")
-    else:
-        outf = sys.stdout
-    
     column_names = []
     if args.name == "start":
         column_names.append("Start")
-        name_func = lambda x: str(x[0]-1)
+        name_func = lambda starts, ends: [starts-1]
     elif args.name == "end":
         column_names.append("End")
-        name_func = lambda x: str(x[1])
+        name_func = lambda starts, ends: [ends]
     elif args.name == "startend":
         column_names.append("Start")
         column_names.append("End")
-        name_func = lambda x: str(x[0]-1)+"\t"+str(x[1])
+        name_func = lambda starts, ends: [starts-1, ends]
     elif args.name == "center":
         column_names.append("Center")
-        name_func = lambda x: str(int(np.mean([x[0], x[1]])-1))
+        name_func = lambda starts, ends: [((starts + ends)/2.0 - 1).astype(int)]
     else:
         raise ValueError("--name %s option not supported. See -h for details"%(args.name))
+    annotation_names, annotate = make_annotator(args)
+    column_names.extend(annotation_names)
+    column_names.extend(window_column_names(args))
 
-    # determine the header for the file
-    if args.far_upstream > 0:
-        for i in xrange(0,args.far_upstream_bins):
-            column_names.append("upstream_window_%i"%i)
-    for i in xrange(0,args.window_bins):
-        column_names.append("window_%i"%i)
-    if args.far_downstream > 0:
-        for i in xrange(0, args.far_downstream_bins):
-            column_names.append("downstream_window_%i"%i)
-    outf.write("\t".join(column_names) + "\n")
-    if args.plot_dist:
-        actual_distros=[]
-    for window in sliding_bounds(args.size, args.genome_length, 
-                                 args.slide_by):
-        outstring = ""
-        windows = None
-        upstream_windows = None
-        downstream_windows = None
-        if args.window_bins > 1:
-            windows = discretize_window(window, direction, args.window_bins)
-        else:
-            windows = [window]
-        if args.far_upstream > 0:
-            upstream_window = add_window(window, args.far_upstream, direction)
-            if args.far_upstream_bins > 1:
-                upstream_windows = discretize_window(upstream_window, direction, 
-                                                     args.far_upstream_bins)
-            else:
-                upstream_windows = [upstream_window]
-
-        if args.far_downstream > 0:
-            downstream_window = add_window(window, args.far_downstream, 
-                                           direction,fiveprime=False)
-            if args.far_downstream_bins > 1:
-                downstream_windows = discretize_window(downstream_window, direction, 
-                                                     args.far_downstream_bins)
-            else:
-                downstream_windows = [downstream_window]
+    # every sliding window has the same layout so lay out the first one and
+    # shift it along the genome
+    window_starts = np.arange(1, args.genome_length+1, args.slide_by)
+    writer = make_window_writer(args, column_names, len(window_starts))
+    upstream_windows, windows, downstream_windows = window_columns(
+            (1, args.size), direction, args.window_bins, args.far_upstream,
+            args.far_upstream_bins, args.far_downstream,
+            args.far_downstream_bins)
+    column_windows = upstream_windows + windows + downstream_windows
+    max_window = max(end - start + 1 for start, end in column_windows)
+    window_stats = []
+    for infile in args.input_data:
+        data, window_signal = load_track(args, infile, max_window)
+        window_stats.append(make_window_stats(args, data, window_signal,
+                                              sliding=True))
+
+    # work through the genome in contiguous chunks of windows. Every chunk
+    # sees the whole track so windows and flanks can reach past the chunk
+    chunk_size = min(SLIDING_CHUNK_SIZE,
+                     -(-len(window_starts)//max(args.workers, 1)))
+    chunks = [window_starts[i:i+chunk_size]
+              for i in xrange(0, len(window_starts), chunk_size)]
+    pool = worker_pool(args.workers, init_sliding_worker,
+                       (window_stats, column_windows))
+    if pool is not None:
+        chunk_values = pool.imap(sliding_chunk_values, chunks)
+    else:
+        chunk_values = itertools.imap(sliding_chunk_values, chunks)
+    # columns of the main window for the first summary stat of each track
+    main_columns = [track*len(args.stat_names)*len(column_windows) +
+                    len(upstream_windows) + i
+                    for track in xrange(len(args.input_data))
+                    for i in xrange(len(windows))]
+    actual_distros = []
+    # chunks come back in genome order
+    for chunk, values in itertools.izip(chunks, chunk_values):
         # output 0 based windows
-        outstring += name_func(window)
-        if upstream_windows:
-            for window in upstream_windows:
-                outstring += "\t%0.4e"%(summary_stat(window_signal(data, window, args.genome_length)))
-        for window in windows:
-            val = summary_stat(window_signal(data, window, args.genome_length))
-            if args.plot_dist:
-                actual_distros.append(val)
-            outstring += "\t%0.4e"%(val)
-
-        if downstream_windows:
-            for window in downstream_windows:
-                outstring += "\t%0.4e"%(summary_stat(window_signal(data, window, args.genome_length)))
-        outf.write(outstring+"\n")
+        writer.write_block(name_func(chunk, chunk + args.size - 1) +
+                           annotate(chunk, chunk + args.size - 1), values)
+        if args.plot_dist:
+            actual_distros.append(values[:,main_columns].ravel())
+    writer.close()
+    if pool is not None:
+        pool.close()
+        pool.join()
     if args.plot_dist:
         import matplotlib.pyplot as plt
         import seaborn as sns
+        actual_distros = np.concatenate(actual_distros)
         if args.o:
             fname = args.o.split(".")[0]
         else:
             fname = "out"
 
-        ax = sns.distplot(np.array(actual_distros), kde=False,color="r")
+        ax = sns.distplot(actual_distros, kde=False,color="r")
         plt.savefig("%s_distributions.png"%(fname))
 
 
-def gff_window_main(args):
-    import gfftools
-
-    center_func ={'median':gff_median_center, 'threeprime':gff_threeprime_center,
-            'fiveprime':gff_fiveprime_center, 'identity':gff_identity_center}
-    center_func = center_func[args.center_metric]
-    data, window_signal = parse_data_into_array(args.input_data, args.genome_length)
-
-
-    if args.genomic_feature is None:
-        if not args.no_finite:
-            data[~np.isfinite(data)] = 0
-        if not args.no_truncate:
-            data[data < 0 ] = 0
-        if args.convert_logical:
-            if len(data.shape) > 1:
-                data[:,1] = data[:,1] > args.convert_logical
-            else:
-                data = data > args.convert_logical
+def init_random_worker(window_stat, genome_length, draws, seed):
+    """
+    Set up the state random_shard_values needs. Run once in each worker
+    process (or in the main process when not using workers)
 
-    summary_stat = args.summary_stat
-    # determine where to write out to
-    if args.o:
-        outf = open(args.o, "w")
+    window_stat - function from make_window_stats for a single summary stat
+    genome_length - int length of the genome
+    draws - number of random windows to draw for each window length
+    seed - int seed the random stream of every shard is made from
+    """
+    global random_worker_state
+    random_worker_state = (window_stat, genome_length, draws, seed)
+
+def random_shard_values(shard):
+    """
+    Summary stat of random windows for a shard of window lengths.
+
+    shard - tuple (shard number, np.array of window lengths, np.array of
+            observed values or None). Each shard draws from its own stream
+            seeded by the seed and the shard number.
+    Returns np.array of the value for every random window or, when observed
+    values are given, only the tuple (pvalues, zscores) of each observed
+    value against its own random windows from empirical_pvalues
+    """
+    window_stat, genome_length, draws, seed = random_worker_state
+    number, window_lengths, observed = shard
+    rng = np.random.RandomState([seed, number])
+    starts, ends = get_random_windows(np.repeat(window_lengths, draws),
+                                      genome_length, rng)
+    values = window_stat(starts, ends)[0]
+    if observed is None:
+        return values
+    return empirical_pvalues(observed, values.reshape(len(window_lengths), draws))
+
+def random_background(args, window_stat, window_lengths, draws, observed=None):
+    """
+    Draw draws random windows the same length as each of window_lengths and
+    calculate window_stat for all of them, split into shards between
+    args.workers processes. The same args.seed always gives the same values.
+
+    Returns np.array of every random value or, when an np.array of the
+    observed value of each window is given, a tuple of np.arrays (pvalues,
+    zscores) from empirical_pvalues. Then only a shard of random values is
+    ever held at once.
+    """
+    shard_lengths = max(1, RANDOM_SHARD_SIZE//draws)
+    shards = [(number, window_lengths[start:start + shard_lengths],
+               None if observed is None else observed[start:start + shard_lengths])
+              for number, start in enumerate(xrange(0, len(window_lengths),
+                                                    shard_lengths))]
+    initargs = (window_stat, args.genome_length, draws, args.seed)
+    pool = worker_pool(args.workers, init_random_worker, initargs)
+    if pool is not None:
+        values = pool.map(random_shard_values, shards)
+        pool.close()
+        pool.join()
     else:
-        outf = sys.stdout
-    
+        values = map(random_shard_values, shards)
+    if observed is None:
+        return np.concatenate(values) if values else np.array([])
+    if not values:
+        return (np.array([]), np.array([]))
+    return tuple(np.concatenate(column) for column in zip(*values))
+
+def gff_geometry(args, name_func):
+    """
+    Lay out the windows of every entry in args.gff_windows at once.
+
+    Inputs:
+        args - parsed command line arguments
+        name_func - function that takes a gff entry and returns a tuple of
+                    the values of the name columns for it
+    Returns:
+        tuple (name_columns, gff_windows, entry_windows, layout)
+        name_columns - list with a np.array for each name column
+        gff_windows - (entries x 2) np.array of the padded window around
+                      each entry
+        entry_windows - (entries x columns x 2) np.array of the window for
+                        every output column of each entry, in output order
+        layout - np.array of the number of upstream, window and downstream
+                 columns
+    """
+    gffs = read_gff_table(args.gff_windows, make_parse_cache(args))
+    names = [name_func(entry) for entry in gffs]
+    starts = gffs.start
+    ends = gffs.end
+    minus = gffs.direction == "-"
+    center_starts, center_ends = gff_centers(starts, ends, minus, args.center_metric)
+    gff_windows = get_gff_windows(center_starts, center_ends, minus,
+                                  args.upstream, args.downstream)
+    columns = window_geometry(gff_windows, minus, args.window_bins,
+                              args.far_upstream, args.far_upstream_bins,
+                              args.far_downstream, args.far_downstream_bins)
+    return ([np.array(column) for column in zip(*names)], gff_windows,
+            np.concatenate(columns, axis=1),
+            np.array([column.shape[1] for column in columns]))
+
+def gff_geometry_cache_file(args):
+    """
+    File the geometry for these arguments is cached in. The name changes
+    whenever the gff file or any of the arguments that change the windows
+    do.
+    """
+    key = repr((os.path.abspath(args.gff_windows),
+                os.path.getsize(args.gff_windows),
+                os.path.getmtime(args.gff_windows), args.name,
+                args.center_metric, args.upstream, args.downstream,
+                args.window_bins, args.far_upstream, args.far_upstream_bins,
+                args.far_downstream, args.far_downstream_bins))
+    return os.path.join(args.geometry_cache, "%s.%s.npz"%(
+                        os.path.basename(args.gff_windows),
+                        hashlib.md5(key).hexdigest()))
+
+def load_gff_geometry(args, name_func):
+    """
+    gff_geometry, read from args.geometry_cache when it has already been
+    worked out for the same gff file and window arguments and saved there
+    otherwise.
+    """
+    if not args.geometry_cache:
+        return gff_geometry(args, name_func)
+    fname = gff_geometry_cache_file(args)
+    if os.path.exists(fname):
+        cached = np.load(fname)
+        nnames = len([key for key in cached.files if key.startswith("name_")])
+        return ([cached["name_%s"%i] for i in xrange(nnames)],
+                cached["gff_windows"], cached["entry_windows"],
+                cached["layout"])
+    geometry = gff_geometry(args, name_func)
+    name_columns, gff_windows, entry_windows, layout = geometry
+    arrays = dict(("name_%s"%i, column) for i, column in enumerate(name_columns))
+    if not os.path.isdir(args.geometry_cache):
+        os.makedirs(args.geometry_cache)
+    # write somewhere else first so a half written cache is never read
+    tmp_fname = "%s.%s.tmp.npz"%(fname[:-len(".npz")], os.getpid())
+    np.savez(tmp_fname, gff_windows=gff_windows, entry_windows=entry_windows,
+             layout=layout, **arrays)
+    os.rename(tmp_fname, fname)
+    return geometry
+
+def gff_window_main(args):
     column_names = []
     if args.name == "fiveprime":
         column_names.append("FiveprimeBase")
-        name_func = lambda x: str(x.end-1) if x.direction is "-" else str(x.start-1)
+        name_func = lambda x: (x.end-1,) if x.direction == "-" else (x.start-1,)
     elif args.name == "threeprime":
         column_names.append("ThreeprimeBase")
-        name_func = lambda x: str(x.start-1) if x.direction is "-" else str(x.end-1)
+        name_func = lambda x: (x.start-1,) if x.direction == "-" else (x.end-1,)
     elif args.name == "startend":
         column_names.append("Start")
         column_names.append("End")
-        name_func = lambda x: str(x.start-1)+"\t"+str(x.end)
+        name_func = lambda x: (x.start-1, x.end)
     elif args.name == "startendstrand":
         column_names.append("Start")
         column_names.append("End")
         column_names.append("Strand")
-        name_func = lambda x: str(x.start-1)+"\t"+str(x.end)+"\t"+str(x.direction)
+        name_func = lambda x: (x.start-1, x.end, x.direction)
     elif args.name == "comments":
         column_names.append("Gene")
         column_names.append("bnumber")
         name_func = parse_entry_for_name
     elif args.name == "center":
         column_names.append("Center")
-        name_func = lambda x: str(int(np.mean([x.start, x.end])-1))
+        name_func = lambda x: (int(np.mean([x.start, x.end])-1),)
     else:
         raise ValueError("--name %s option not supported. See -h for details"%(args.name))
-
-    # determine the header for the file
-    if args.far_upstream > 0:
-        for i in xrange(0,args.far_upstream_bins):
-            column_names.append("upstream_window_%i"%i)
-    for i in xrange(0,args.window_bins):
-        column_names.append("window_%i"%i)
-    if args.far_downstream > 0:
-        for i in xrange(0, args.far_downstream_bins):
-            column_names.append("downstream_window_%i"%i)
-    outf.write("\t".join(column_names) + "\n")
+    annotation_names, annotate = make_annotator(args)
+    column_names.extend(annotation_names)
+    column_names.extend(window_column_names(args))
+    if args.pvalues:
+        # significance of each gff window against its own random windows,
+        # a pair of columns for each track
+        pvalue_names = ["pvalue", "zscore"]
+        if len(args.input_data) > 1:
+            pvalue_names = ["%s_%s"%(label, name)
+                            for label in track_labels(args.input_data)
+                            for name in pvalue_names]
+        column_names.extend(pvalue_names)
+        pvalue_columns = []
     if args.distributions:
         actual_distros=[]
         random_distros=[]
-    gffs = gfftools.GffData()
-    gffs.parse_gff_file(args.gff_windows)
-    for entry in gffs:
-        outstring = ""
-        windows = None
-        upstream_windows = None
-        downstream_windows = None
-        outstring += name_func(entry)
-        window = get_gff_window(entry, args.upstream, args.downstream, center_func)
+    if args.seed is None:
+        args.seed = np.random.randint(2**31)
+    name_columns, gff_windows, entry_windows, layout = load_gff_geometry(args, name_func)
+    nentries = len(entry_windows)
+    writer = make_window_writer(args, column_names, nentries)
+    if nentries:
+        max_window = max(np.max(entry_windows[:,:,1] - entry_windows[:,:,0]),
+                         np.max(gff_windows[:,1] - gff_windows[:,0])) + 1
+    else:
+        max_window = None
+    # the window layout is shared by every track
+    track_values = []
+    for infile in args.input_data:
+        data, window_signal = load_track(args, infile, max_window)
         if args.distributions:
-            for x in xrange(args.distributions):
-                random_distros.append(summary_stat(window_signal(data, get_random_window(window[1]-window[0]+1, args.genome_length), args.genome_length)))
-        if args.window_bins > 1:
-            windows = discretize_window(window, entry.direction, args.window_bins)
-        else:
-            windows = [window]
-        if args.far_upstream > 0:
-            upstream_window = add_window(window, args.far_upstream, entry.direction)
-            if args.far_upstream_bins > 1:
-                upstream_windows = discretize_window(upstream_window, entry.direction, 
-                                                     args.far_upstream_bins)
-            else:
-                upstream_windows = [upstream_window]
-
-        if args.far_downstream > 0:
-            downstream_window = add_window(window, args.far_downstream, 
-                                           entry.direction,fiveprime=False)
-            if args.far_downstream_bins > 1:
-                downstream_windows = discretize_window(downstream_window, entry.direction, 
-                                                     args.far_downstream_bins)
-            else:
-                downstream_windows = [downstream_window]
-        if upstream_windows:
-            for window in upstream_windows:
-                outstring += "\t%0.4e"%(summary_stat(window_signal(data, window, args.genome_length)))
-        for window in windows:
-            val = summary_stat(window_signal(data, window, args.genome_length))
-            if args.distributions:
-                actual_distros.append(val)
-            outstring += "\t%0.4e"%(val)
-
-        if downstream_windows:
-            for window in downstream_windows:
-                outstring += "\t%0.4e"%(summary_stat(window_signal(data, window, args.genome_length)))
-        outf.write(outstring+"\n")
+            window_stat = make_window_stats(args, data, window_signal, nstats=1)
+            random_distros.append(random_background(args, window_stat,
+                                                    gff_windows[:,1] - gff_windows[:,0] + 1,
+                                                    args.distributions))
+        if args.pvalues and nentries:
+            window_stat = make_window_stats(args, data, window_signal, nstats=1)
+            observed = window_stat(gff_windows[:,0], gff_windows[:,1])[0]
+            pvalue_columns.extend(random_background(args, window_stat,
+                                                    gff_windows[:,1] - gff_windows[:,0] + 1,
+                                                    args.pvalues, observed))
+        if nentries:
+            # look up every entry's windows one column at a time
+            window_stats = make_window_stats(args, data, window_signal)
+            track_values.extend(stat_blocks(window_stats,
+                                            [(entry_windows[:,i,0], entry_windows[:,i,1])
+                                             for i in xrange(entry_windows.shape[1])]))
+    if nentries:
+        if args.pvalues:
+            track_values.extend(pvalue_columns)
+        values = np.column_stack(track_values)
+        writer.write_block(name_columns + annotate(gff_windows[:,0], gff_windows[:,1]),
+                           values)
+        if args.distributions:
+            ncolumns = len(args.stat_names)*entry_windows.shape[1]
+            main_columns = [track*ncolumns + layout[0] + i
+                            for track in xrange(len(args.input_data))
+                            for i in xrange(layout[1])]
+            actual_distros = values[:,main_columns].ravel()
+    writer.close()
     if args.distributions:
         import matplotlib.pyplot as plt
         import seaborn as sns
@@ -371,8 +1218,8 @@ def gff_window_main(args):
         else:
             fname = "out"
 
-        ax = sns.distplot(np.array(actual_distros), color="r")
-        ax = sns.distplot(np.array(random_distros), color="b")
+        ax = sns.distplot(actual_distros, color="r")
+        ax = sns.distplot(np.concatenate(random_distros), color="b")
         plt.savefig("%s_distributions.png"%(fname))
 
 
@@ -402,15 +1249,23 @@ if __name__ == "__main__":
                                help="summary stat to calculate for each window.\
                                      [mean = mean of the signal in the window,\
                                       median = median of the signal in the window,\
+                                      qN = Nth percentile of the signal in the window e.g. q90,\
+                                      min, max, std = minimum, maximum or standard deviation of\
+                                      the signal in the window,\
                                       cutoff = if a number is specified then return 1\
                                       if any datapoint is over the cutoff,\
                                       density = determine data density for a window\
                                       i.e. number of data points in the window\
                                       genomic = choosing a genomic feature, must specify --genomic_feature flag]\
-                                      default= mean.")
+                                      Several stats can be given separated by commas e.g. mean,median,density\
+                                      and each gets a block of columns. default= mean.")
     parent_parser.add_argument("--genomic_feature", nargs=2, type=str, help="When --summary_stat genomic is specified, this flag MUST be specified\
                                                                              Choose the type of genomic feature desired:\
                                                                              [motif regex gives count of motifs in the window\
+                                                                              motifhits regex gives count of motifs on either strand of the window,\
+                                                                              including overlapping ones, from an index of the whole genome\
+                                                                              kmers k gives a column for the frequency of each k-mer of length k\
+                                                                              in the window, e.g. kmers 2 for dinucleotide composition\
                                                                               basecontent base1;base2;...etc. \
                                                                               gives fraction of window that is/are that/those base(s). \
                                                                               Also works with dinucleotide, tri... etc. Specifiying\
@@ -419,19 +1274,56 @@ if __name__ == "__main__":
     parent_parser.add_argument('-o', action='store', type=str,
                               help='output file to put the output into (default stdout)')
 
+    parent_parser.add_argument('--output_format', choices=["text", "npy", "npz"], default="text",
+                               help="text = tab delimited table, npy = structured array with a field\
+                                     for each column, npz = an array for each column. npy and npz\
+                                     need -o. default = text")
     parent_parser.add_argument('--no_truncate', action="store_true",help="don't truncate\
                         values below zero to zero.")
     parent_parser.add_argument('--no_finite', action="store_true",help="don't truncate\
                         non-finite values to zero.")
+    parent_parser.add_argument('--dtype', choices=sorted(TRACK_DTYPES.keys()), default=None,
+                               help="type to store the data array as. Smaller types use less memory.\
+                                     int32 and bool tracks can't hold nans so non-finite values\
+                                     become 0. default = as read")
+    parent_parser.add_argument('--mmap', action="store_true", help="memory map .npy\
+                        input instead of reading it into memory. Only pages that are changed\
+                        get copied, so store the .npy already cleaned and as the --dtype wanted")
+    parent_parser.add_argument('--packed_genome', action="store_true", help="read\
+                        fasta input into memory at 2 bits per base instead of reading each\
+                        window from the file. Bases other than A, C, G and T are kept but\
+                        lower case bases become upper case")
+    parent_parser.add_argument('--parse_cache', action="store", type=str, default=None,
+                               help="directory to cache the arrays parsed from .gr, .bed and .gff\
+                                     files in. Later runs on the same unchanged files load them\
+                                     from there instead of parsing the text again")
+    parent_parser.add_argument('--parse_cache_size', action="store", type=float, default=2048,
+                               help="megabytes --parse_cache can grow to before the least\
+                                     recently used files are removed, default=2048")
+    parent_parser.add_argument('--landmarks', action="store_true", help="add columns of the\
+                        distance from the center of each window to oriC and to ter, going\
+                        whichever way around the genome is shorter")
+    parent_parser.add_argument('--oriC', type=int, default=3923883, help="0-based position of\
+                        oriC for --landmarks, default=3923883 (E. coli MG1655)")
+    parent_parser.add_argument('--ter', type=int, default=None, help="0-based position of\
+                        ter for --landmarks, default=opposite oriC")
+    parent_parser.add_argument('--nearest_gff', type=str, default=None, help="add columns of\
+                        the 0-based fiveprime base of the feature in this .gff file whose\
+                        fiveprime base is nearest the center of each window, and the distance\
+                        to it. The distance is negative when the window center is upstream\
+                        of the feature and positive when it is downstream")
     parent_parser.add_argument('--convert_logical', type=float, default=None,help="convert the data array to a logical array that is true if the data point is above a cutoff value")
 
     sliding_parser = subparsers.add_parser('sliding', help="do a sliding window over the genome")
-    sliding_parser.add_argument("input_data", action='store', type=str,
+    sliding_parser.add_argument("input_data", action='store', type=str, nargs="+",
                                help="input data. Accepted types include .gr,\
-                                     .npy")
+                                     .npy, .bed, fasta and .npz summary pyramids from the pyramid\
+                                     command. Multiple tracks can be given and each\
+                                     gets a block of columns in the output")
     sliding_parser.add_argument("size", type=int,help="size of the sliding window")
     sliding_parser.add_argument("slide_by", type=int,help="number of basepairs to slide by")
     sliding_parser.add_argument("--plot_dist", action="store_true", help="plot the distribution of the values in the main window")
+    sliding_parser.add_argument("--workers", type=int, default=1, help="number of processes to split the genome between, default=1")
     sliding_parser.add_argument('--name', action='store', type=str, default='startend',
                                 help='[startend = put the start and end of the region,\
                                        start = put only the starting bp,\
@@ -440,9 +1332,11 @@ if __name__ == "__main__":
                                        default=startend')
      
     gff_parser = subparsers.add_parser('gff_window', help="define windows from a gff")
-    gff_parser.add_argument("input_data", action='store', type=str,
+    gff_parser.add_argument("input_data", action='store', type=str, nargs="+",
                                help="input data. Accepted types include .gr,\
-                                     .npy")
+                                     .npy, .bed, fasta and .npz summary pyramids from the pyramid\
+                                     command. Multiple tracks can be given and each\
+                                     gets a block of columns in the output")
     gff_parser.add_argument('gff_windows', action='store', type=str,
                               help='gff file containing windows to scan')
     gff_parser.add_argument('--center_metric', action='store', type=str, default='identity',
@@ -465,27 +1359,60 @@ if __name__ == "__main__":
                                    center = put the center of the region median(start,end)]\
                                    default=startend')
 
+    gff_parser.add_argument('--geometry_cache', action="store", type=str,
+                            help="directory to cache the window layout of the gff in. Runs with\
+                                  the same gff and window options read it from there instead\
+                                  of working it out again")
     gff_parser.add_argument('--distributions', action="store", type=int,
                          help="plot the distribution of the data set in the ranges compared\
-                               to randomly sample bins of the same length")
+                               to randomly sample bins of the same length. Takes the number of\
+                               random bins to sample for each range and uses the first --summary_stat")
+    gff_parser.add_argument('--pvalues', action="store", type=int,
+                            help="add pvalue and zscore columns comparing the first --summary_stat\
+                                  over each whole gff window (with --upstream and --downstream) to\
+                                  this many random bins of the same length. The pvalue is the\
+                                  fraction of random bins at least as high")
+    gff_parser.add_argument('--seed', action="store", type=int,
+                            help="seed for the random bins of --distributions and --pvalues,\
+                                  default = a different seed each run")
+    gff_parser.add_argument("--workers", type=int, default=1, help="number of processes to split\
+                            the random bins of --distributions and --pvalues between, default=1")
+    pyramid_parser = subparsers.add_parser('pyramid', help="precompute a summary pyramid of a track\
+                                           so that windows can later be summarized without a full pass\
+                                           over the track. Supports the mean, density, min, max, std and\
+                                           cutoff summary stats")
+    pyramid_parser.add_argument("input_data", action='store', type=str,
+                                help="input data. Accepted types include .gr, .npy and .bed")
+    pyramid_parser.add_argument("outfile", action='store', type=str,
+                                help=".npz file to save the pyramid to")
+    pyramid_parser.add_argument("--factor", action='store', type=int, default=10,
+                                help="number of bins of each resolution that make up a bin of\
+                                      the next, default=10 i.e. 1, 10, 100 ... bp")
     args = parent_parser.parse_args()
 
     gffs = gfftools.GffData()
-    summary_stat = {'mean': np.mean, 'median': np.median, 'density': lambda x: len(x)}
-    if args.summary_stat in summary_stat.keys():
-        args.summary_stat = summary_stat[args.summary_stat]
-    elif args.summary_stat == "genomic":
-        args.summary_stat = parse_genomic_feature_type(args.genomic_feature) 
-    else:
-        try:
-            cutoff = float(args.summary_stat)
-            args.summary_stat = lambda x : any_over_cutoff(x, cutoff)
-        except:
-            print "Error interpreting number for cutoff summary stat %s"%args.summary_stat
-            raise
+    args.stat_names = args.summary_stat.split(",")
+    if args.genomic_feature and args.genomic_feature[0] == "kmers":
+        # a stat, and so a block of columns, for each k-mer
+        if "genomic" not in args.stat_names:
+            parent_parser.error("--genomic_feature kmers needs --summary_stat genomic")
+        genomic = args.stat_names.index("genomic")
+        args.stat_names[genomic:genomic + 1] = kmer_stat_names(args.genomic_feature[1])
+    input_data = args.input_data if isinstance(args.input_data, list) else [args.input_data]
+    if any(infile.lower().endswith(FASTA_EXTENSIONS) for infile in input_data):
+        numeric_stats = [stat_name for stat_name in args.stat_names
+                         if stat_name != "genomic" and not stat_name.startswith("kmer:")
+                         and stat_name not in SEQUENCE_STATS]
+        if numeric_stats:
+            parent_parser.error("--summary_stat %s can't be calculated on fasta input, only genomic and density can"%
+                                ",".join(numeric_stats))
+    args.summary_stats = [parse_summary_stat(stat_name, args.genomic_feature)
+                          for stat_name in args.stat_names]
     if args.command == "sliding": 
         sliding_window_main(args)
     elif args.command == "gff_window":
         gff_window_main(args)
+    elif args.command == "pyramid":
+        pyramid_main(args)
     else:
         raise ValueError("unsupported command")
@@ -29,6 +29,7 @@
 import bisect
 import numpy as np
 import gfftools
+import fasta
 import random
 
 
@@ -300,6 +301,61 @@ def get_random_window(window_length, genome_length):
     window = (bin_start, bin_start+window_length-1)
     return window
 
+def get_random_windows(window_lengths, genome_length, rng=np.random):
+    """
+    Vectorized get_random_window: find a random window in the genome for
+    each of an array of window lengths. Assumes a circular genome.
+
+    Inputs:
+        window_lengths - np.array of int lengths in bp of the windows
+        genome_length - int length of genome to sample from
+        rng - np.random.RandomState to draw from, default the global one
+    Returns:
+        tuple of np.arrays (starts, ends) of the random windows in 1-based
+        inclusive coordinates
+
+    >>> starts, ends = get_random_windows(np.array([30, 5]), 400,
+    ...                                   np.random.RandomState(1))
+    >>> (ends - starts + 1).tolist()
+    [30, 5]
+    """
+    # same range as get_random_window
+    starts = rng.randint(0, genome_length + 1, size=len(window_lengths))
+    return (starts, starts + window_lengths - 1)
+
+def empirical_pvalues(observed, background):
+    """
+    Compare each observed value to its own background of random values.
+
+    Inputs:
+        observed - np.array of a value for each window
+        background - (windows x draws) np.array of the values of the random
+                     windows matched to each window. nans are left out.
+    Returns:
+        tuple of np.arrays (pvalues, zscores). pvalues are the one sided
+        empirical p-value of a value at least as high as observed, counting
+        the observed value as one of the draws so it is never 0. zscores
+        are nan when the background doesn't vary.
+
+    >>> pvalues, zscores = empirical_pvalues(np.array([3., 0.]),
+    ...                                      np.array([[0., 1., 2.], [0., 1., 2.]]))
+    >>> pvalues.tolist(), np.round(zscores, 4).tolist()
+    ([0.25, 1.0], [2.4495, -1.2247])
+    """
+    finite = np.isfinite(background)
+    draws = finite.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        exceed = (np.where(finite, background, -np.inf) >= observed[:,np.newaxis]).sum(axis=1)
+        pvalues = (exceed + 1.0)/(draws + 1.0)
+        totals = np.where(finite, background, 0).sum(axis=1)
+        means = totals/draws
+        deviations = np.where(finite, background - means[:,np.newaxis], 0)
+        stds = np.sqrt((deviations**2).sum(axis=1)/draws)
+        zscores = (observed - means)/stds
+    pvalues[np.isnan(observed)] = np.nan
+    zscores[~np.isfinite(zscores)] = np.nan
+    return (pvalues, zscores)
+
 def simple_window_signal_circular(signal, window, genome_size):
     """ Given a signal numpy array from 0-genome size and a window in
     1-based inclusive coordinates, return a slice of the signal array within
@@ -325,18 +381,144 @@ def simple_window_signal_circular(signal, window, genome_size):
     array([1])
     """
     # convert gff coordinate to 0 based coordinate
-    window = list(window)
-    window[0] = window[0] -1
-    if window[0] < 0:
-        window[0] = genome_size + window[0]
-        window[1] = genome_size + window[1]
-    if window[1] >= genome_size:
-        window_sig = np.append(signal[window[0]:genome_size], signal[0:window[1]-genome_size])
+    start = window[0] - 1
+    end = window[1]
+    if start < 0:
+        start = genome_size + start
+        end = genome_size + end
+    if end >= genome_size:
+        window_sig = np.append(signal[start:genome_size], signal[0:end-genome_size])
     else:
-        window_sig = signal[window[0]:window[1]]
+        window_sig = signal[start:end]
 
     return window_sig
 
+class CircularSignal(object):
+    """ Per bp signal over a circular genome stored with the first
+    max_window values repeated after the end of the genome, so that any
+    window up to max_window long is a contiguous view of the signal, even if
+    it crosses the origin. Nothing is copied or allocated per window.
+
+    Inputs:
+        signal - 1d np.array of values for every bp in genome_size
+        genome_size - size of the genome
+        max_window - longest window in bp that should come back as a view.
+                     Defaults to the whole genome
+
+    Attributes:
+        signal - view of the padded array covering just the genome. Use this
+                 in place of the original signal array
+        padded - the signal followed by the first max_window values again
+
+    >>> track = CircularSignal(np.array([1, 2, 3, 4, 5, 6]), 6, max_window=4)
+    >>> track.window_signal(track.signal, (-1, 2), 6)
+    array([5, 6, 1, 2])
+    >>> track.window_signal(track.signal, (6, 8), 6)
+    array([6, 1, 2])
+    >>> track.window_signal(track.signal, (6, 8), 6).base is track.padded
+    True
+    >>> track.window_signal(track.signal, (1, 12), 6)
+    array([1, 2, 3, 4, 5, 6, 1, 2, 3, 4, 5, 6])
+    """
+
+    def __init__(self, signal, genome_size, max_window=None):
+        self.genome_size = genome_size
+        if len(signal) != genome_size:
+            # windows could only wrap in the same way as
+            # simple_window_signal_circular if the signal covers the genome
+            self.max_window = 0
+        elif max_window is None:
+            self.max_window = genome_size
+        else:
+            self.max_window = min(max_window, genome_size)
+        self.padded = np.empty(len(signal) + self.max_window, dtype=signal.dtype)
+        self.padded[:len(signal)] = signal
+        self.padded[len(signal):] = signal[:self.max_window]
+        self.signal = self.padded[:len(signal)]
+
+    def window_signal(self, signal, window, genome_size):
+        """ Drop in replacement for simple_window_signal_circular. When
+        signal is this track's signal and the window is no longer than
+        max_window the slice is a view of the padded array, otherwise it
+        falls back to simple_window_signal_circular.
+        """
+        start = window[0] - 1
+        end = window[1]
+        if start < 0:
+            start = genome_size + start
+            end = genome_size + end
+        if (signal is self.signal and genome_size == self.genome_size and
+                start < genome_size and end - genome_size <= self.max_window):
+            return self.padded[start:end]
+        return simple_window_signal_circular(signal, window, genome_size)
+
+def complex_window_indices_circular(locs, starts, ends, genome_size):
+    """ Given the sorted locations of a sparse signal and arrays of windows in
+    1-based inclusive coordinates, find the [start, end) indices of the
+    locations that fall in each window. All windows are looked up with a
+    single search.
+    Assumes windows are in [1-end] coordinates and locs are in
+    [0-end) coordinates and the genome is circular
+
+    Inputs:
+        locs - 1d sorted np.array of locations with signal
+        starts - int or np.array of window starts
+        ends - int or np.array of inclusive window ends
+        genome_size - size of the genome
+
+    Output:
+        tuple(startindices, endindices) of np.arrays of indices into locs.
+        If a window wraps around the end of the genome then
+        startindex > endindex and the window covers locs[startindex:]
+        followed by locs[:endindex]
+
+    >>> locs = np.array([0, 1, 5, 35, 55, 99])
+    >>> complex_window_indices_circular(locs, [1, 37, 36, 98], [2, 55, 56, 102], 100)
+    (array([6, 4, 3, 5]), array([2, 4, 5, 2]))
+    >>> complex_window_indices_circular(locs, -2, 2, 100)
+    (array([5]), array([2]))
+    """
+    # change windows to 0 based index
+    startbp = np.atleast_1d(starts) - 1
+    endbp = np.atleast_1d(ends)
+
+    # make sure we have sorted windows
+    startbp, endbp = np.minimum(startbp, endbp), np.maximum(startbp, endbp)
+
+    # deal with being outside the genome in a circular manner
+    startbp = np.where(startbp < 1, startbp + genome_size, startbp)
+    endbp = np.where(endbp > locs[-1], endbp - genome_size, endbp)
+
+    # find what locations to pull for all the windows at once
+    indices = np.searchsorted(locs, np.concatenate((startbp, endbp)))
+    return (indices[:len(startbp)], indices[len(startbp):])
+
+def complex_window_signals(data, starts, ends, genome_size):
+    """ Generator over the signal in each of an array of windows. Same as
+    calling complex_window_signal_circular on each window, but all of the
+    windows are looked up at once and windows that don't wrap around the end
+    of the genome are views into data rather than copies.
+
+    Inputs:
+        data - 2d np.array of [loc, signal] rows sorted by loc
+        starts - np.array of window starts in 1-based coordinates
+        ends - np.array of inclusive window ends in 1-based coordinates
+        genome_size - size of the genome
+
+    >>> data = np.column_stack([[0, 1, 5, 35, 55, 99], [1, 2, 3, 4, 5, 6]])
+    >>> list(complex_window_signals(data, [1, 37, 98], [2, 56, 102], 100))
+    [array([1, 2]), array([5]), array([6, 1, 2])]
+    """
+    signal = data[:,1]
+    startindices, endindices = complex_window_indices_circular(data[:,0],
+                                                               starts, ends,
+                                                               genome_size)
+    for startindex, endindex in zip(startindices.tolist(), endindices.tolist()):
+        if startindex > endindex:
+            yield np.concatenate((signal[startindex:], signal[:endindex]))
+        else:
+            yield signal[startindex:endindex]
+
 def complex_window_signal_circular(data, window, genome_size, return_locs=False):
     """ Given a signal numpy array from 0-genome size and a window in
     1-based inclusive coordinates, return a slice of the signal array within
@@ -377,31 +559,11 @@ def complex_window_signal_circular(data, window, genome_size, return_locs=False)
     """
     signal = data[:,1]
     locs = data[:,0]
-    # first location in window
-    # change window to 0 based index
-    startbp = window[0] - 1
-    # last location in window
-    # change window to 0 based index
-    endbp = window[1]
-    
-    # search where in the locs array?
-    searchleft_start = 0
-    searchleft_end = len(locs)
-    searchright_start = searchleft_start
-    searchright_end = searchleft_end
-
-    # make sure we have a sorted window:
-    if startbp > endbp:
-        startbp, endbp = endbp, startbp
-
-    # deal with being outside the genome in a circular manner
-    if startbp < 1:
-        startbp += genome_size
-    if endbp > locs[-1]:
-        endbp -= genome_size
-    # find what locations to pull
-    startindex = bisect.bisect_left(locs, startbp, searchleft_start, searchleft_end)
-    endindex = bisect.bisect_left(locs, endbp, searchright_start, searchleft_end)
+    startindex, endindex = complex_window_indices_circular(locs, window[0],
+                                                           window[1],
+                                                           genome_size)
+    startindex = startindex[0]
+    endindex = endindex[0]
 
     if (startindex > endindex):
         locs_slice = np.concatenate((locs[startindex:], locs[:endindex]))
@@ -416,6 +578,984 @@ def complex_window_signal_circular(data, window, genome_size, return_locs=False)
         return(data_slice)
 
 
+def window_columns(window, strand, window_bins=1, far_upstream=0,
+                   far_upstream_bins=1, far_downstream=0,
+                   far_downstream_bins=1):
+    """
+    Given a window, lay out every window that gets its own output column in
+    the order they are written: upstream bins, window bins then downstream
+    bins.
+
+    Inputs:
+        window - tuple(start, end) in 1-based inclusive coordinates
+        strand - strand associated with the window
+        window_bins - number of bins to break the window into
+        far_upstream - int bp to add upstream of the window, 0 for none
+        far_upstream_bins - number of bins to break the upstream window into
+        far_downstream - int bp to add downstream of the window, 0 for none
+        far_downstream_bins - number of bins to break the downstream window
+                              into
+    Returns:
+        tuple of lists (upstream_windows, windows, downstream_windows)
+
+    >>> window_columns((1, 10), "+", 2, far_upstream=4)
+    ([(-3, 0)], [(1, 5), (6, 10)], [])
+    >>> window_columns((1, 10), "-", far_downstream=4, far_downstream_bins=2)
+    ([], [(1, 10)], [(-1, 0), (-3, -2)])
+    """
+    upstream_windows = []
+    downstream_windows = []
+    if window_bins > 1:
+        windows = discretize_window(window, strand, window_bins)
+    else:
+        windows = [window]
+    if far_upstream > 0:
+        upstream_window = add_window(window, far_upstream, strand)
+        if far_upstream_bins > 1:
+            upstream_windows = discretize_window(upstream_window, strand,
+                                                 far_upstream_bins)
+        else:
+            upstream_windows = [upstream_window]
+    if far_downstream > 0:
+        downstream_window = add_window(window, far_downstream, strand,
+                                       fiveprime=False)
+        if far_downstream_bins > 1:
+            downstream_windows = discretize_window(downstream_window, strand,
+                                                   far_downstream_bins)
+        else:
+            downstream_windows = [downstream_window]
+    return (upstream_windows, windows, downstream_windows)
+
+def gff_centers(starts, ends, minus, center_metric):
+    """
+    Vectorized version of the gff_*_center functions for arrays of gff
+    entries.
+
+    Inputs:
+        starts - np.array of gff start coordinates
+        ends - np.array of gff end coordinates
+        minus - bool np.array, True for entries on the minus strand
+        center_metric - one of median, threeprime, fiveprime or identity
+    Returns:
+        tuple of np.arrays (starts, ends) of the center of each entry
+
+    >>> starts, ends = gff_centers(np.array([1, 1]), np.array([10, 10]),
+    ...                            np.array([False, True]), "threeprime")
+    >>> starts.tolist(), ends.tolist()
+    ([10, 1], [10, 1])
+    """
+    if center_metric == "median":
+        # same as int(np.median([start, end])) for positive coordinates
+        median = (starts + ends)//2
+        return (median, median)
+    elif center_metric == "threeprime":
+        threeprime = np.where(minus, starts, ends)
+        return (threeprime, threeprime)
+    elif center_metric == "fiveprime":
+        fiveprime = np.where(minus, ends, starts)
+        return (fiveprime, fiveprime)
+    elif center_metric == "identity":
+        return (starts, ends)
+    else:
+        raise KeyError(center_metric)
+
+def get_gff_windows(starts, ends, minus, fiveprime, threeprime):
+    """
+    Vectorized get_gff_window for arrays of already centered windows.
+
+    Inputs:
+        starts, ends - np.arrays of 1-based inclusive window coordinates
+        minus - bool np.array, True for windows on the minus strand
+        fiveprime - int number of bp to pad in the fiveprime direction
+        threeprime - int number of bp to pad in the threeprime direction
+    Returns:
+        (windows x 2) np.array of (start, end) of each padded window
+
+    >>> get_gff_windows(np.array([50, 50]), np.array([70, 70]),
+    ...                 np.array([False, True]), 5, 2).tolist()
+    [[45, 72], [48, 75]]
+    """
+    return np.column_stack((starts - np.where(minus, threeprime, fiveprime),
+                            ends + np.where(minus, fiveprime, threeprime)))
+
+def discretize_windows(windows, minus, bins):
+    """
+    Vectorized discretize_window for an array of windows.
+
+    Inputs:
+        windows - (windows x 2) np.array of 1-based inclusive (start, end)
+        minus - bool np.array, True for windows on the minus strand
+        bins - number of bins to break each window into
+    Returns:
+        (windows x bins x 2) np.array of the bins of each window in the 5' to
+        3' direction according to strand
+
+    >>> discretize_windows(np.array([[1, 10], [1, 11]]),
+    ...                    np.array([False, True]), 2).tolist()
+    [[[1, 5], [6, 10]], [[6, 11], [1, 5]]]
+    >>> discretize_windows(np.array([[1, 3]]), np.array([False]), 4)
+    Traceback (most recent call last):
+        ...
+    ValueError: bins are larger than size of window. Window (1, 3), bins 4, windowlength 3
+    """
+    window_lengths = windows[:,1] + 1 - windows[:,0]
+    too_short = np.flatnonzero(window_lengths < bins)
+    if len(too_short):
+        i = too_short[0]
+        raise ValueError("bins are larger than size of window. Window %s, bins %s, windowlength %s"%(
+                         (int(windows[i,0]), int(windows[i,1])), bins, window_lengths[i]))
+    binsizes = window_lengths//bins
+    bin_starts = windows[:,0,np.newaxis] + binsizes[:,np.newaxis]*np.arange(bins)
+    bin_ends = bin_starts + binsizes[:,np.newaxis] - 1
+    # the last bin takes up any remainder
+    bin_ends[:,-1] = windows[:,1]
+    out = np.dstack((bin_starts, bin_ends))
+    out[minus] = out[minus,::-1]
+    return out
+
+def add_windows(windows, size, minus, fiveprime=True):
+    """
+    Vectorized add_window for an array of windows.
+
+    Inputs:
+        windows - (windows x 2) np.array of 1-based inclusive (start, end)
+        size - int size in bp of the new windows
+        minus - bool np.array, True for windows on the minus strand
+        fiveprime - bool add the new windows on the five prime side
+    Returns:
+        (windows x 2) np.array of the new windows
+
+    >>> add_windows(np.array([[50, 70], [50, 70]]), 20,
+    ...             np.array([False, True])).tolist()
+    [[30, 49], [71, 90]]
+    """
+    before = minus != fiveprime
+    return np.column_stack((np.where(before, windows[:,0] - size, windows[:,1] + 1),
+                            np.where(before, windows[:,0] - 1, windows[:,1] + size)))
+
+def window_geometry(windows, minus, window_bins=1, far_upstream=0,
+                    far_upstream_bins=1, far_downstream=0,
+                    far_downstream_bins=1):
+    """
+    Vectorized window_columns: lay out every window that gets its own output
+    column for an array of windows at once.
+
+    Inputs:
+        windows - (windows x 2) np.array of 1-based inclusive (start, end)
+        minus - bool np.array, True for windows on the minus strand
+        the rest as for window_columns
+    Returns:
+        tuple of np.arrays (upstream_windows, windows, downstream_windows),
+        each (windows x columns x 2)
+
+    >>> up, main, down = window_geometry(np.array([[1, 10]]), np.array([False]),
+    ...                                  2, far_upstream=4)
+    >>> up.tolist(), main.tolist(), down.shape
+    ([[[-3, 0]]], [[[1, 5], [6, 10]]], (1, 0, 2))
+    """
+    def columns(column_windows, bins):
+        if bins > 1:
+            return discretize_windows(column_windows, minus, bins)
+        return column_windows[:,np.newaxis,:]
+
+    no_windows = np.empty((len(windows), 0, 2), dtype=windows.dtype)
+    upstream_windows = no_windows
+    downstream_windows = no_windows
+    if far_upstream > 0:
+        upstream_windows = columns(add_windows(windows, far_upstream, minus),
+                                   far_upstream_bins)
+    if far_downstream > 0:
+        downstream_windows = columns(add_windows(windows, far_downstream, minus,
+                                                 fiveprime=False),
+                                     far_downstream_bins)
+    return (upstream_windows, columns(windows, window_bins), downstream_windows)
+
+def circular_window_ranges(data, starts, ends, genome_size):
+    """
+    Find the part of the signal each window covers. Windows that go over
+    the end of the genome are split in two, the second range always
+    starting at the beginning of the signal. Gives the same ranges that
+    simple_window_signal_circular (1d signal) or
+    complex_window_signal_circular (2d [loc, signal] data) slice out.
+
+    Inputs:
+        data - 1d np.array of values for every bp or 2d np.array of
+               [loc, signal] rows sorted by loc
+        starts - np.array of window starts in 1-based coordinates
+        ends - np.array of inclusive window ends in 1-based coordinates
+        genome_size - size of the genome
+    Returns:
+        tuple(first_start, first_end, second_end) of np.arrays of
+        [start, end) indices into the signal. second_end is 0 for
+        windows that don't wrap.
+
+    >>> circular_window_ranges(np.arange(6), [1, -1, 6], [2, 2, 8], 6)
+    (array([0, 4, 5]), array([2, 6, 6]), array([0, 2, 2]))
+    """
+    signal_length = len(data)
+    if len(data.shape) == 1:
+        # same circular handling as simple_window_signal_circular
+        starts = np.asarray(starts) - 1
+        ends = np.asarray(ends)
+        before_origin = starts < 0
+        starts = np.where(before_origin, starts + genome_size, starts)
+        ends = np.where(before_origin, ends + genome_size, ends)
+        wraps = ends >= genome_size
+        first_end = np.where(wraps, genome_size, ends)
+        second_end = np.where(wraps, ends - genome_size, 0)
+    else:
+        starts, ends = complex_window_indices_circular(data[:,0], starts,
+                                                       ends, genome_size)
+        wraps = starts > ends
+        first_end = np.where(wraps, signal_length, ends)
+        second_end = np.where(wraps, ends, 0)
+    # mimic slicing past the end of the signal
+    first_start = np.minimum(starts, signal_length)
+    first_end = np.maximum(np.minimum(first_end, signal_length), first_start)
+    second_end = np.minimum(second_end, signal_length)
+    return (first_start, first_end, second_end)
+
+def prefix_sum(values, dtype=float):
+    """
+    Cumulative sum of values with a 0 in front of it, so the sum of
+    values[start:end] is prefix[end] - prefix[start]
+
+    >>> prefix_sum(np.array([True, False, True]), dtype=int)
+    array([0, 1, 1, 2])
+    """
+    prefix = np.zeros(len(values) + 1, dtype=dtype)
+    np.cumsum(values, dtype=dtype, out=prefix[1:])
+    return prefix
+
+class PrefixSumSignal(object):
+    """
+    Cumulative sum of a signal over a circular genome. Built once per track,
+    after which the sum, number of data points and mean of any number of
+    windows are found with a few array lookups instead of re-summing the
+    signal in each window.
+
+    Gives the same answers as taking the sum, length or mean of the slices
+    returned by simple_window_signal_circular (1d signal) or
+    complex_window_signal_circular (2d [loc, signal] data). Windows with a
+    nan or inf in them get the nan or inf np.sum would give them without
+    affecting any other window. Every value is split into a multiple of a
+    power of two step, whose cumulative sum is exact, and the small
+    remainder, so the sum of a window is as precise as adding up its own
+    values however large the rest of the track is.
+
+    Inputs:
+        data - 1d np.array of values for every bp or 2d np.array of
+               [loc, signal] rows sorted by loc
+        genome_size - size of the genome
+
+    >>> sig = PrefixSumSignal(np.array([1, 2, 3, 4, 5, 6]), 6)
+    >>> sig.mean(np.array([1, -1, 6, 1]), np.array([2, 2, 8, 1]))
+    array([1.5, 3.5, 3. , 1. ])
+    >>> sig.count(np.array([1, -1, 6]), np.array([2, 2, 8]))
+    array([2, 4, 3])
+    >>> data = np.column_stack([[0, 1, 5, 35, 55, 99], [1, 2, 3, 4, 5, 6]])
+    >>> sig = PrefixSumSignal(data, 100)
+    >>> sig.sum(np.array([1, 37, 36, 98, -2]), np.array([2, 55, 56, 102, 2]))
+    array([3., 0., 9., 9., 9.])
+    >>> sig.count(np.array([1, 37, 36, 98, -2]), np.array([2, 55, 56, 102, 2]))
+    array([2, 0, 2, 3, 3])
+    >>> sig = PrefixSumSignal(np.array([1, np.nan, 2, np.inf, 2, 2]), 6)
+    >>> sig.mean(np.array([1, 1, 3, 5]), np.array([1, 2, 4, 6]))
+    array([ 1., nan, inf,  2.])
+    >>> sig = PrefixSumSignal(np.concatenate([np.full(10**5, 1e3), np.full(6, 1e-6)]), 10**5 + 6)
+    >>> "%0.4e"%sig.mean(np.array([10**5 + 1]), np.array([10**5 + 3]))[0]
+    '1.0000e-06'
+    """
+
+    def __init__(self, data, genome_size):
+        self.data = data
+        self.genome_size = genome_size
+        if len(data.shape) > 1:
+            signal = data[:,1]
+        else:
+            signal = data
+        signal = np.asarray(signal, dtype=float)
+        finite = np.isfinite(signal)
+        self.nonfinite = None
+        if not finite.all():
+            # number of nans, infs and -infs, which are left out of the sums
+            self.nonfinite = (prefix_sum(np.isnan(signal), dtype=int),
+                              prefix_sum(signal == np.inf, dtype=int),
+                              prefix_sum(signal == -np.inf, dtype=int))
+            signal = np.where(finite, signal, 0)
+        # the step is small enough that the sum of the coarse values of the
+        # whole track, added to or taken from itself a few times, still fits
+        # in the 53 bit mantissa of a float, so those sums are exact
+        total = np.abs(signal).sum()
+        exponent = np.ceil(np.log2(total)) - 50 if total > 0 else 0
+        step = 2.0**max(exponent, -1000)
+        coarse = np.round(signal/step)*step
+        self.coarse_cumsum = prefix_sum(coarse)
+        self.fine_cumsum = prefix_sum(signal - coarse)
+
+    def ranges(self, starts, ends):
+        """
+        See circular_window_ranges
+        """
+        return circular_window_ranges(self.data, starts, ends,
+                                      self.genome_size)
+
+    def sum(self, starts, ends):
+        """
+        Sum of the signal in each window. See circular_window_ranges for
+        inputs
+        """
+        first_start, first_end, second_end = self.ranges(starts, ends)
+        window_sum = lambda prefix: (prefix[first_end] - prefix[first_start]) + prefix[second_end]
+        sums = window_sum(self.coarse_cumsum) + window_sum(self.fine_cumsum)
+        if self.nonfinite is not None:
+            nans, infs, neg_infs = [window_sum(prefix) for prefix in self.nonfinite]
+            sums = np.where(infs > 0, np.inf, np.where(neg_infs > 0, -np.inf, sums))
+            sums[(nans > 0) | ((infs > 0) & (neg_infs > 0))] = np.nan
+        return sums
+
+    def count(self, starts, ends):
+        """
+        Number of data points in each window. See circular_window_ranges for
+        inputs
+        """
+        first_start, first_end, second_end = self.ranges(starts, ends)
+        return (first_end - first_start) + second_end
+
+    def mean(self, starts, ends):
+        """
+        Mean of the signal in each window, nan for empty windows. See
+        circular_window_ranges for inputs
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sum(starts, ends)/self.count(starts, ends)
+
+class SummaryPyramid(object):
+    """
+    Sum, number of data points, minimum, maximum and sum of squares of a
+    signal over bins of 1, factor, factor**2 ... bp, up to a single bin
+    covering the whole genome. Built once per track, after which any
+    window is summarized from at most 2*(factor-1) bins of each
+    resolution instead of from every bp, so long windows come from the
+    coarsest bins that fit inside them.
+
+    Windows are handled like simple_window_signal_circular handles them.
+    Data points with non-finite values are left out.
+
+    Inputs:
+        levels - list of dicts of np.arrays, one for each resolution,
+                 starting at 1 bp, with a key for each of STATS
+        genome_size - size of the genome
+        factor - how many bins of each resolution make up a bin of the next
+
+    >>> pyramid = SummaryPyramid.from_data(np.arange(25.0), 25, factor=3)
+    >>> [len(level["sum"]) for level in pyramid.levels]
+    [25, 9, 3, 1]
+    >>> summaries = pyramid.window_summaries(np.array([1, 3, 24]), np.array([25, 20, 27]))
+    >>> summaries["sum"], summaries["count"], summaries["max"]
+    (array([300., 189.,  48.]), array([25., 18.,  4.]), array([24., 19., 24.]))
+    >>> data = np.array([[3, 1.], [3, 2.], [7, -1.]])
+    >>> pyramid = SummaryPyramid.from_data(data, 10, factor=2)
+    >>> summaries = pyramid.window_summaries(np.array([1, 5, 1]), np.array([4, 6, 10]))
+    >>> summaries["count"], summaries["min"], summaries["sumsq"]
+    (array([2., 0., 3.]), array([ 1., nan, -1.]), array([5., 0., 6.]))
+    """
+    STATS = ("sum", "count", "min", "max", "sumsq")
+
+    def __init__(self, levels, genome_size, factor=10):
+        self.levels = levels
+        self.genome_size = genome_size
+        self.factor = factor
+
+    @classmethod
+    def from_data(cls, data, genome_size, factor=10):
+        """
+        Build the pyramid from a 1d np.array of values for every bp or a
+        2d np.array of [loc, signal] rows
+        """
+        if len(data.shape) > 1:
+            locs = data[:,0].astype(int) % genome_size
+            signal = data[:,1].astype(float)
+        else:
+            signal = data[:genome_size].astype(float)
+            locs = np.arange(len(signal))
+        finite = np.isfinite(signal)
+        locs = locs[finite]
+        signal = signal[finite]
+        level = {"sum": np.bincount(locs, signal, genome_size),
+                 "count": np.bincount(locs, None, genome_size).astype(float),
+                 "sumsq": np.bincount(locs, signal**2, genome_size),
+                 "min": np.full(genome_size, np.inf),
+                 "max": np.full(genome_size, -np.inf)}
+        np.minimum.at(level["min"], locs, signal)
+        np.maximum.at(level["max"], locs, signal)
+        levels = [level]
+        while len(level["sum"]) > 1:
+            level = cls.coarsen(level, factor)
+            levels.append(level)
+        return cls(levels, genome_size, factor)
+
+    @staticmethod
+    def coarsen(level, factor):
+        """
+        Combine every factor bins of a level into one bin of the next. The
+        last bin takes whatever is left over.
+        """
+        nbins = -(-len(level["sum"])//factor)
+        padding = nbins*factor - len(level["sum"])
+        fills = {"sum": 0, "count": 0, "sumsq": 0, "min": np.inf,
+                 "max": -np.inf}
+        combine = {"sum": np.sum, "count": np.sum, "sumsq": np.sum,
+                   "min": np.min, "max": np.max}
+        coarse = {}
+        for stat in SummaryPyramid.STATS:
+            values = np.concatenate((level[stat], np.full(padding, fills[stat])))
+            coarse[stat] = combine[stat](values.reshape(nbins, factor), axis=1)
+        return coarse
+
+    def save(self, fname):
+        """
+        Write the pyramid to an .npz file
+        """
+        arrays = dict(("%s_%i"%(stat, i), level[stat])
+                      for i, level in enumerate(self.levels)
+                      for stat in self.STATS)
+        np.savez(fname, genome_size=self.genome_size, factor=self.factor,
+                 **arrays)
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Read a pyramid written by save. Only the arrays of the resolutions
+        that are used get read in.
+        """
+        saved = np.load(fname)
+        nlevels = len([key for key in saved.files if key.startswith("sum_")])
+        levels = [LazyLevel(saved, i) for i in xrange(nlevels)]
+        return cls(levels, int(saved["genome_size"]), int(saved["factor"]))
+
+    def range_summaries(self, lo, hi):
+        """
+        Summarize the bp in [lo, hi) of each range, with lo and hi np.arrays
+        of 0-based positions between 0 and genome_size.
+
+        Returns a dict with an np.array for each of STATS
+        """
+        lo = np.asarray(lo)
+        hi = np.asarray(hi)
+        totals = {"sum": np.zeros(len(lo)), "count": np.zeros(len(lo)),
+                  "sumsq": np.zeros(len(lo)), "min": np.full(len(lo), np.inf),
+                  "max": np.full(len(lo), -np.inf)}
+        factor = self.factor
+        for i, level in enumerate(self.levels):
+            if i == len(self.levels) - 1:
+                self._add_bins(totals, level, lo, hi)
+                break
+            # bins of the next level that fit inside the range
+            coarse_lo = -(-lo//factor)
+            coarse_hi = hi//factor
+            finished = coarse_lo >= coarse_hi
+            left_end = np.where(finished, hi, coarse_lo*factor)
+            right_start = np.where(finished, hi, coarse_hi*factor)
+            self._add_bins(totals, level, lo, left_end)
+            self._add_bins(totals, level, right_start, hi)
+            lo = np.where(finished, 0, coarse_lo)
+            hi = np.where(finished, 0, coarse_hi)
+            if not len(lo) or finished.all():
+                break
+        return totals
+
+    @staticmethod
+    def _add_bins(totals, level, lo, hi):
+        """
+        Add the bins [lo, hi) of a level to the totals
+        """
+        widths = hi - lo
+        if not len(widths) or widths.max() <= 0:
+            return
+        for offset in xrange(widths.max()):
+            inside = offset < widths
+            bins = (lo + offset)[inside]
+            for stat in ("sum", "count", "sumsq"):
+                totals[stat][inside] += level[stat][bins]
+            totals["min"][inside] = np.minimum(totals["min"][inside], level["min"][bins])
+            totals["max"][inside] = np.maximum(totals["max"][inside], level["max"][bins])
+
+    def window_summaries(self, starts, ends):
+        """
+        Summarize each window. starts and ends are np.arrays of 1-based
+        inclusive coordinates.
+
+        Returns a dict with an np.array for each of STATS. min and max are
+        nan for windows without any data.
+        """
+        genome = np.empty(self.genome_size, dtype=np.bool_)
+        first_start, first_end, second_end = circular_window_ranges(
+                genome, starts, ends, self.genome_size)
+        totals = self.range_summaries(np.concatenate((first_start, np.zeros_like(second_end))),
+                                      np.concatenate((first_end, second_end)))
+        nwindows = len(first_start)
+        summaries = {}
+        for stat in ("sum", "count", "sumsq"):
+            summaries[stat] = totals[stat][:nwindows] + totals[stat][nwindows:]
+        summaries["min"] = np.minimum(totals["min"][:nwindows], totals["min"][nwindows:])
+        summaries["max"] = np.maximum(totals["max"][:nwindows], totals["max"][nwindows:])
+        empty = summaries["count"] == 0
+        summaries["min"][empty] = np.nan
+        summaries["max"][empty] = np.nan
+        return summaries
+
+class LazyLevel(object):
+    """
+    One resolution of a saved SummaryPyramid. Each array is read from the
+    .npz file the first time it is used.
+    """
+
+    def __init__(self, saved, level):
+        self.saved = saved
+        self.level = level
+        self.arrays = {}
+
+    def __getitem__(self, stat):
+        if stat not in self.arrays:
+            self.arrays[stat] = self.saved["%s_%i"%(stat, self.level)]
+        return self.arrays[stat]
+
+def circular_sequence_ranges(starts, ends, genome_size):
+    """
+    Window coordinates moved into two copies of the genome the same way
+    FastaEntry.pull_seq moves them with circ=True, so that each window's
+    sequence is (seq + seq)[start:end].
+
+    Inputs:
+        starts - np.array of window starts in 1-based coordinates
+        ends - np.array of inclusive window ends in 1-based coordinates
+        genome_size - size of the genome
+    Returns:
+        tuple of np.arrays of 0-based [start, end)
+
+    >>> circular_sequence_ranges(np.array([1, 0, 9]), np.array([3, 2, 12]), 10)
+    (array([0, 9, 8]), array([ 3, 12, 12]))
+    """
+    starts = np.asarray(starts) - 1
+    ends = np.asarray(ends)
+    shift = np.where(starts < 0, genome_size,
+                     np.where(starts >= genome_size, -genome_size, 0))
+    starts = starts + shift
+    ends = np.minimum(ends + shift, 2*genome_size)
+    return (starts, ends)
+
+def kmer_has_border(kmer):
+    """
+    Whether a k-mer can overlap itself, in which case non-overlapping and
+    overlapping counts of it can differ
+
+    >>> kmer_has_border("AA"), kmer_has_border("ATA"), kmer_has_border("GC")
+    (True, True, False)
+    """
+    return any(kmer[:i] == kmer[-i:] for i in xrange(1, len(kmer)))
+
+class KmerCounts(object):
+    """
+    Running counts of where k-mers occur along a circular chromosome,
+    built once so that the number of times each k-mer occurs in any window
+    is two array lookups instead of a search of the window's sequence.
+    Single bases are just k-mers of length 1. Overlapping occurrences,
+    and ones across the origin, are all counted.
+
+    Inputs:
+        seq - str sequence of the chromosome
+        kmers - list of k-mers to count
+
+    >>> counts = KmerCounts("GCATGCAAGC", ["GC", "A", "C"])
+    >>> counts.count("GC", np.array([1, 9, 1]), np.array([10, 12, 1])).tolist()
+    [3, 2, 0]
+    >>> counts.frequencies(["A", "C"], np.array([1, 4]), np.array([4, 6]))
+    array([[0.25      , 0.25      ],
+           [0.        , 0.33333333]])
+    """
+
+    def __init__(self, seq, kmers):
+        seq = seq.upper()
+        self.genome_size = len(seq)
+        codes = np.frombuffer(seq, dtype=np.uint8)
+        self.cumulative = {}
+        for kmer in set(kmers):
+            self.cumulative[kmer] = self.kmer_cumsum(codes, kmer)
+
+    def kmer_cumsum(self, codes, kmer):
+        """
+        Number of occurrences of kmer starting before each position, as
+        an np.array one longer than the genome
+        """
+        genome_size = self.genome_size
+        # the end of the genome continues into its start
+        repeats = -(-(genome_size + len(kmer) - 1)//genome_size)
+        circular = np.tile(codes, repeats)
+        found = np.ones(genome_size, dtype=np.bool_)
+        for i, base in enumerate(kmer):
+            found &= circular[i:i + genome_size] == ord(base)
+        cumsum = np.zeros(genome_size + 1, dtype=np.int32)
+        np.cumsum(found, out=cumsum[1:])
+        return cumsum
+
+    def count(self, kmer, starts, ends):
+        """
+        Number of times kmer occurs inside each window, given np.arrays of
+        1-based inclusive window starts and ends
+        """
+        genome_size = self.genome_size
+        cumsum = self.cumulative[kmer]
+        starts, ends = circular_sequence_ranges(starts, ends, genome_size)
+        # occurrences starting at or after the start that still end by the
+        # end, first in the genome and then in its second copy
+        last_starts = ends - len(kmer) + 1
+        first_end = np.maximum(np.minimum(last_starts, genome_size), starts)
+        second_end = np.clip(last_starts - genome_size, 0, genome_size)
+        return (cumsum[first_end] - cumsum[np.minimum(starts, genome_size)] +
+                cumsum[second_end])
+
+    def lengths(self, starts, ends):
+        """
+        Length of the sequence of each window
+        """
+        starts, ends = circular_sequence_ranges(starts, ends, self.genome_size)
+        return np.maximum(ends - starts, 0)
+
+    def frequencies(self, kmers, starts, ends):
+        """
+        Composition of each window: the fraction of the places a k-mer could
+        start in the window that each of kmers starts at
+
+        Returns (windows x kmers) np.array, nan for windows too short for
+        a k-mer
+        """
+        lengths = self.lengths(starts, ends)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.column_stack([self.count(kmer, starts, ends)/
+                                    (lengths - len(kmer) + 1.0).clip(0)
+                                    for kmer in kmers])
+
+class MotifHitIndex(object):
+    """
+    Every hit of a motif on both strands of a circular chromosome, found
+    with one scan of each strand. Overlapping hits and hits across the
+    origin are included. Afterwards the number of hits in any number of
+    windows comes from binary searches of the hit positions instead of
+    searching the sequence of each window again.
+
+    A hit is counted in a window when it lies entirely inside it. For
+    motifs that always match the same, non-zero length and don't look
+    around the match this gives the same counts as
+    searching the sequence pull_seq returns for the window, on both
+    strands, with overlapped=True.
+
+    Inputs:
+        seq - str sequence of the chromosome
+        motif - compiled pattern from the regex module
+
+    >>> import regex
+    >>> index = MotifHitIndex("ATCAAGAATG", regex.compile("GA"))
+    >>> index.starts.tolist(), index.ends.tolist()
+    ([1, 5, 9], [3, 7, 11])
+    >>> index.count(np.array([1, 8, 1, 1]), np.array([4, 11, 10, 1]))
+    array([1, 1, 2, 0])
+    """
+
+    def __init__(self, seq, motif):
+        seq = seq.upper()
+        genome_size = len(seq)
+        # hits on the forward strand and the reverse strand in forward
+        # strand coordinates. Two copies of the sequence are searched so
+        # hits over the origin are found, keeping those that start in the
+        # first copy
+        starts = []
+        ends = []
+        for match in motif.finditer(seq + seq, overlapped=True):
+            if match.start() >= genome_size:
+                break
+            starts.append(match.start())
+            ends.append(match.end())
+        reverse = fasta.complement(seq)[::-1]
+        for match in motif.finditer(reverse + reverse, overlapped=True):
+            if match.start() >= genome_size:
+                break
+            start = 2*genome_size - match.end()
+            if start >= genome_size:
+                start -= genome_size
+            starts.append(start)
+            ends.append(start + match.end() - match.start())
+        order = np.argsort(starts, kind="mergesort")
+        self.starts = np.array(starts, dtype=int)[order]
+        self.ends = np.array(ends, dtype=int)[order]
+        self.genome_size = genome_size
+        self.max_length = np.max(self.ends - self.starts) if len(starts) else 0
+        # a window can reach into a second copy of the genome, so keep the
+        # hits of two copies in order of start and the ends sorted too
+        self.copy_starts = np.concatenate((self.starts, self.starts + genome_size))
+        self.copy_hit_ends = np.concatenate((self.ends, self.ends + genome_size))
+        self.copy_ends = np.sort(self.copy_hit_ends, kind="mergesort")
+
+    def count(self, starts, ends):
+        """
+        Number of hits inside each window, given np.arrays of 1-based
+        inclusive window starts and ends
+        """
+        starts, ends = circular_sequence_ranges(starts, ends, self.genome_size)
+        # hits ending by the end of the window less those starting before
+        # it, which is right unless a hit can cover the whole window
+        counts = (np.searchsorted(self.copy_ends, ends, side="right") -
+                  np.searchsorted(self.copy_starts, starts, side="left"))
+        for i in np.flatnonzero(ends - starts + 2 <= self.max_length):
+            first = np.searchsorted(self.copy_starts, starts[i], side="left")
+            last = np.searchsorted(self.copy_starts, ends[i], side="left")
+            counts[i] = np.sum(self.copy_hit_ends[first:last] <= ends[i])
+        return counts
+
+def circular_distance(positions, landmark, genome_size):
+    """
+    Distance from each position to landmark going whichever way around the
+    genome is shorter
+
+    >>> circular_distance(np.array([0, 5, 90]), 2, 100)
+    array([ 2,  3, 12])
+    """
+    distance = np.abs(np.asarray(positions) - landmark) % genome_size
+    return np.minimum(distance, genome_size - distance)
+
+class NearestFeatureIndex(object):
+    """
+    Sorted positions of features, such as gene starts, for finding the
+    nearest one to many positions at once around a circular genome.
+
+    Inputs:
+        positions - np.array of the position of each feature
+        minus - boolean np.array of whether each feature is on the - strand
+        genome_size - size of the genome
+
+    >>> index = NearestFeatureIndex(np.array([50, 10, 95]), np.array([False, True, False]), 100)
+    >>> index.nearest(np.array([12, 2, 30, 60]))
+    (array([1, 2, 1, 0]), array([ -2,   7, -20,  10]))
+    """
+    def __init__(self, positions, minus, genome_size):
+        positions = np.asarray(positions)
+        if len(positions) == 0:
+            raise ValueError("need at least one feature to find the nearest one")
+        self.order = np.argsort(positions, kind="mergesort")
+        self.positions = positions[self.order]
+        self.minus = np.asarray(minus, dtype=bool)[self.order]
+        self.genome_size = genome_size
+
+    def nearest(self, positions):
+        """
+        Find the nearest feature to each position.
+
+        Returns:
+            tuple (features, distances) of np.arrays. features are indices
+            into the positions the index was made with. distances are signed
+            by the strand of the feature: negative when the position is
+            upstream of it and positive when it is downstream
+        """
+        positions = np.asarray(positions)
+        nfeatures = len(self.positions)
+        after = np.searchsorted(self.positions, positions, "right")
+        # the nearest feature either way around the genome is the last one at
+        # or before the position or the first one after it
+        before = (after - 1) % nfeatures
+        after = after % nfeatures
+        before_distance = circular_distance(positions, self.positions[before], self.genome_size)
+        after_distance = circular_distance(positions, self.positions[after], self.genome_size)
+        nearest = np.where(after_distance < before_distance, after, before)
+        half = self.genome_size//2
+        distances = (positions - self.positions[nearest] + half) % self.genome_size - half
+        distances = np.where(self.minus[nearest], -distances, distances)
+        return self.order[nearest], distances
+
+def sorted_median(values):
+    """
+    Median of an already sorted list, same as np.median. nan if the list is
+    empty.
+
+    >>> sorted_median([1, 2, 3])
+    2
+    >>> sorted_median([1.0, 2.0, 3.0, 10.0])
+    2.5
+    """
+    length = len(values)
+    if length == 0:
+        return np.nan
+    middle = length//2
+    if length % 2:
+        return values[middle]
+    return (values[middle-1] + values[middle])/2.0
+
+def sorted_quantile(values, quantile):
+    """
+    Quantile of an already sorted list, interpolating linearly between the
+    closest ranks like np.percentile. The 50th percentile is found the same
+    way as sorted_median. nan if the list is empty.
+
+    Only the values at the closest ranks are looked at, so values can also
+    be an array partitioned around them (see window_quantiles).
+
+    Inputs:
+        values - sorted list or np.array
+        quantile - percentile between 0 and 100
+
+    >>> sorted_quantile([1.0, 2.0, 3.0, 4.0, 5.0], 25)
+    2.0
+    >>> sorted_quantile([1.0, 2.0, 3.0, 4.0], 50)
+    2.5
+    >>> sorted_quantile([1.0, 2.0, 3.0, 4.0], 90)
+    3.7
+    """
+    if quantile == 50:
+        return sorted_median(values)
+    length = len(values)
+    if length == 0:
+        return np.nan
+    index = quantile/100.0*(length-1)
+    below = int(np.floor(index))
+    above = min(below + 1, length - 1)
+    weight = index - below
+    return values[below]*(1 - weight) + values[above]*weight
+
+def quantile_ranks(length, quantiles):
+    """
+    Ranks sorted_quantile looks at to find each of quantiles in a list of
+    length values.
+
+    >>> quantile_ranks(10, [50, 90])
+    [4, 5, 8, 9]
+    """
+    ranks = set()
+    if length == 0:
+        return []
+    for quantile in quantiles:
+        if quantile == 50:
+            ranks.update(((length-1)//2, length//2))
+        else:
+            below = int(np.floor(quantile/100.0*(length-1)))
+            ranks.update((below, min(below + 1, length - 1)))
+    return sorted(ranks)
+
+def window_quantiles(signal, quantiles):
+    """
+    Several quantiles of the signal in one window from a single partial
+    sort. The 50th percentile is the same as np.median.
+
+    Inputs:
+        signal - np.array of the signal in a window
+        quantiles - list of percentiles between 0 and 100
+    Returns:
+        list with each quantile, all nan if the window is empty or has nans
+
+    >>> window_quantiles(np.array([5, 1, 4, 2, 3]), [50, 25, 100])
+    [3, 2.0, 5.0]
+    """
+    if len(signal) == 0 or (signal.dtype.kind == "f" and np.isnan(signal).any()):
+        return [np.nan]*len(quantiles)
+    if signal.dtype.kind == "b":
+        # interpolating between booleans would act as a logical or
+        signal = signal.astype(float)
+    partitioned = np.partition(signal, quantile_ranks(len(signal), quantiles))
+    return [sorted_quantile(partitioned, quantile) for quantile in quantiles]
+
+def rolling_window_quantiles(data, starts, ends, genome_size, quantiles):
+    """
+    Quantiles of the signal in each of an array of windows. Meant for windows
+    that slide along the genome: the values in the current window are kept
+    sorted and as the window moves only the values that leave are removed
+    and the values that enter are inserted, instead of sorting each window
+    from scratch. Windows that jump backwards or further than their own
+    length are re-sorted. Every quantile is read off the same sorted window.
+
+    Gives the same answers as window_quantiles of the slices returned by
+    simple_window_signal_circular (1d signal) or
+    complex_window_signal_circular (2d [loc, signal] data), including
+    windows that wrap around the end of the genome. The signal must not
+    contain nans.
+
+    Inputs:
+        data - 1d np.array of values for every bp or 2d np.array of
+               [loc, signal] rows sorted by loc
+        starts - np.array of window starts in 1-based coordinates
+        ends - np.array of inclusive window ends in 1-based coordinates
+        genome_size - size of the genome
+        quantiles - list of percentiles between 0 and 100
+    Returns:
+        list with a np.array for each quantile of the value in each window,
+        nan for empty windows
+
+    >>> signal = np.array([5, 1, 4, 2, 3, 6])
+    >>> rolling_window_quantiles(signal, np.arange(1, 7), np.arange(3, 9), 6, [0, 50])
+    [array([1., 1., 2., 2., 3., 1.]), array([4., 2., 3., 3., 5., 5.])]
+    """
+    if len(data.shape) > 1:
+        signal = data[:,1]
+    else:
+        signal = data
+    signal_length = len(signal)
+    first_start, first_end, second_end = circular_window_ranges(data, starts,
+                                                                ends,
+                                                                genome_size)
+    # treat each window as one [start, end) range of the signal repeated
+    # twice. Wrapping windows over a signal that is longer than the genome
+    # don't fit this and are calculated directly
+    contiguous = (second_end == 0) | (first_end == signal_length)
+    range_ends = np.where(second_end > 0, signal_length + second_end, first_end)
+    # only pull out the part of the doubled signal these windows cover
+    if len(first_start):
+        offset = np.min(first_start)
+        doubled_end = np.max(range_ends)
+    else:
+        offset = doubled_end = 0
+    values = np.concatenate((signal[offset:], signal[:max(doubled_end - signal_length, 0)]))
+    values = values.astype(float).tolist()
+    first_start = first_start - offset
+    range_ends = range_ends - offset
+
+    results = np.empty((len(quantiles), len(first_start)))
+    window = []
+    prev_start = prev_end = 0
+    for i, (start, end, is_contiguous) in enumerate(zip(first_start.tolist(),
+                                                        range_ends.tolist(),
+                                                        contiguous.tolist())):
+        if not is_contiguous:
+            results[:,i] = window_quantiles(np.concatenate((signal[offset+start:first_end[i]],
+                                                            signal[:second_end[i]])),
+                                            quantiles)
+            window = []
+            prev_start = prev_end = 0
+            continue
+        moved = (start - prev_start) + (end - prev_end)
+        if start < prev_start or end < prev_end or moved > end - start:
+            window = sorted(values[start:end])
+        else:
+            for val in values[prev_start:start]:
+                del window[bisect.bisect_left(window, val)]
+            for val in values[prev_end:end]:
+                bisect.insort(window, val)
+        prev_start, prev_end = start, end
+        for j, quantile in enumerate(quantiles):
+            results[j,i] = sorted_quantile(window, quantile)
+    return list(results)
+
+def rolling_window_median(data, starts, ends, genome_size):
+    """
+    Median of the signal in each of an array of sliding windows. Same as
+    np.median of each window. See rolling_window_quantiles
+
+    >>> signal = np.array([5, 1, 4, 2, 3, 6])
+    >>> rolling_window_median(signal, np.arange(1, 7), np.arange(3, 9), 6)
+    array([4., 2., 3., 3., 5., 5.])
+    >>> data = np.column_stack([[0, 1, 5, 35, 55, 99], [1, 2, 3, 4, 5, 6]])
+    >>> rolling_window_median(data, np.array([1, 37, 36, 98]), np.array([2, 55, 56, 102]), 100)
+    array([1.5, nan, 4.5, 2. ])
+    """
+    return rolling_window_quantiles(data, starts, ends, genome_size, [50])[0]
+
+
 def sliding_bounds(size, length, slide_by=1):
     """
     Generator for a sliding window across a length.